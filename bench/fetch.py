@@ -0,0 +1,71 @@
+"""
+Measure get_json throughput with and without the pooled ClientSession.
+
+    uv run python -m bench.fetch [-n REQUESTS] [-c CONCURRENCY]
+
+Requests go to a local aiohttp.web stand-in, so only client overhead is
+measured.
+"""
+
+import asyncio
+import sys
+import time
+from argparse import ArgumentParser
+from contextlib import AsyncExitStack, asynccontextmanager
+
+from aiohttp.web import Application, AppRunner, Request, Response, TCPSite
+
+from bot.lib.fetch.aio import get_json, session_context
+
+
+async def main() -> int:
+    args = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    args.add_argument("-n", "--requests", type=int, default=2000)
+    args.add_argument("-c", "--concurrency", type=int, default=8)
+    kwargs = args.parse_args()
+
+    async with _serve() as origin:
+        for label, pooled in (("one-shot sessions", False), ("pooled session", True)):
+            async with AsyncExitStack() as stack:
+                if pooled:
+                    await stack.enter_async_context(session_context())
+                elapsed = await _run(origin, kwargs.requests, kwargs.concurrency)
+            print(f"{label:<18} {kwargs.requests / elapsed:>8.0f} req/s")
+    return 0
+
+
+async def _run(origin: str, requests: int, concurrency: int) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int) -> None:
+        async with semaphore:
+            # Distinct queries, so in-flight coalescing does not kick in.
+            await get_json(f"{origin}/json", queries={"i": str(index)})
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(_) for _ in range(requests)))
+    return time.perf_counter() - started
+
+
+@asynccontextmanager
+async def _serve():
+    """A local server answering every request with a small JSON body."""
+    app = Application()
+    app.router.add_get("/json", _handle_json)
+    runner = AppRunner(app, access_log=None)
+    await runner.setup()
+    try:
+        site = TCPSite(runner, host="127.0.0.1", port=0)
+        await site.start()
+        host, port = runner.addresses[0][:2]
+        yield f"http://{host}:{port}"
+    finally:
+        await runner.cleanup()
+
+
+async def _handle_json(_request: Request) -> Response:
+    return Response(text='{"ok": true}', content_type="application/json")
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
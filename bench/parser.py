@@ -0,0 +1,77 @@
+"""
+Compare CPU time and peak memory of the get_html parser strategies.
+
+    uv run python -m bench.parser [saved.html ...]
+
+Without pages, a synthetic product page is used.
+"""
+
+import sys
+import time
+import tracemalloc
+from argparse import ArgumentParser
+from pathlib import Path
+
+from bot.lib.fetch.parser import DEFAULT_PARSER, HtmlParser, fast_parser
+
+
+_STRATEGIES: dict[str, HtmlParser] = {
+    "html.parser": DEFAULT_PARSER,
+    "lxml": fast_parser(),
+    "lxml, table only": fast_parser("table"),
+}
+
+
+def main() -> int:
+    args = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    args.add_argument("pages", nargs="*", type=Path)
+    args.add_argument("-n", "--rounds", type=int, default=20)
+    kwargs = args.parse_args()
+
+    pages = {_.name: _.read_text(errors="replace") for _ in kwargs.pages}
+    if not pages:
+        pages = {"synthetic": _make_page()}
+
+    print(f"{'page':<24} {'strategy':<18} {'cpu ms':>8} {'peak KiB':>10}")
+    for name, text in pages.items():
+        for label, parser in _STRATEGIES.items():
+            cpu, peak = _measure(parser, text, kwargs.rounds)
+            print(
+                f"{name[:24]:<24} {label:<18} {cpu * 1000:>8.2f} {peak / 1024:>10.0f}"
+            )
+    return 0
+
+
+def _measure(parser: HtmlParser, text: str, rounds: int) -> tuple[float, int]:
+    """Average CPU seconds per parse, and peak memory of a single parse."""
+    parser.parse(text)
+
+    started = time.process_time()
+    for _ in range(rounds):
+        parser.parse(text)
+    cpu = (time.process_time() - started) / rounds
+
+    tracemalloc.start()
+    parser.parse(text)
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return cpu, peak
+
+
+def _make_page() -> str:
+    """A page shaped like a store listing: lots of markup, one table."""
+    noise = "".join(
+        f'<div class="item"><a href="/item/{i}"><img src="/{i}.jpg" alt="item {i}">'
+        f"<span>Item {i}</span></a><p>{'lorem ipsum ' * 20}</p></div>"
+        for i in range(2000)
+    )
+    rows = "".join(f"<tr><td>field {i}</td><td>value {i}</td></tr>" for i in range(30))
+    return (
+        "<html><head><title>product</title><script>var x = 1;</script></head>"
+        f"<body><nav>{noise}</nav><table>{rows}</table>"
+        "<footer>footer</footer></body></html>"
+    )
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+"""
+Time URL resolution over a corpus of affiliate links that need no network.
+
+    uv run python -m bench.resolve [-n ROUNDS]
+
+Compares the offline planner with the same resolvers driven through an
+awaited loop, one step at a time, as they were before the planner.
+"""
+
+import asyncio
+import sys
+import time
+from argparse import ArgumentParser
+from base64 import urlsafe_b64encode
+from collections.abc import Callable
+from urllib.parse import quote
+
+from bot.lib.url import (
+    _HOST_TO_URL_RESOLVER,
+    _from_url,
+    _Network,
+    _Pack,
+    _plan_offline,
+    _Pure,
+    maybe_resolve_url,
+)
+
+
+_TARGET = "https://www.dmm.co.jp/digital/videoa/-/detail/=/cid=abc00123/?i3_ref=x&y=1"
+_B64 = urlsafe_b64encode(_TARGET.encode()).decode()
+_CORPUS = [
+    f"https://al.dmm.co.jp/?lurl={quote(_TARGET)}&af_id=x",
+    f"https://al.fanza.co.jp/?lurl={quote(_TARGET)}",
+    f"https://al.dmm.com/?lurl={quote(_TARGET)}&ch=toolbar",
+    f"https://lp.ixd.dmm.com/x?lpurl={quote(_TARGET)}",
+    f"https://ip.affiliate.dmm.com/?lurl='{_B64}'",
+    f"https://numa2.com/?u={_B64}",
+    f"https://www.dmm.co.jp/age_check/=/declared=yes/?rurl={quote(_TARGET)}",
+    f"https://accounts.dmm.co.jp/service/login/password/=/path={quote(_TARGET)}",
+    "https://dmm.co.jp/mono/dvd/-/detail/=/cid=abc123/?a=1",
+    "https://video.dmm.co.jp/av/content/?id=abc00123&b=2",
+    "https://www.dlsite.com/maniax-touch/work/=/product_id/RJ123.html?utm=1",
+]
+
+
+async def main() -> int:
+    args = ArgumentParser(description=__doc__.strip().splitlines()[0])
+    args.add_argument("-n", "--rounds", type=int, default=2000)
+    kwargs = args.parse_args()
+
+    for url in _CORPUS:
+        _pack, resolve = _plan_offline(_from_url(url))
+        if resolve:
+            raise RuntimeError(f"needs the network: {url}")
+        expected = await _resolve_awaited(url)
+        if await maybe_resolve_url(url) != expected:
+            raise RuntimeError(f"results differ: {url}")
+
+    links = len(_CORPUS) * kwargs.rounds
+    for label, resolve in (
+        ("awaited steps", _resolve_awaited),
+        ("offline planner", _resolve_planned),
+        ("maybe_resolve_url", maybe_resolve_url),
+    ):
+        started = time.perf_counter()
+        for _ in range(kwargs.rounds):
+            for url in _CORPUS:
+                await resolve(url)
+        elapsed = time.perf_counter() - started
+        print(f"{label:<18} {elapsed / links * 1e6:>8.2f} us/link")
+    return 0
+
+
+async def _resolve_planned(url: str) -> str:
+    pack, _resolve = _plan_offline(_from_url(url))
+    return pack.url
+
+
+async def _resolve_awaited(url: str) -> str:
+    """Await every step, pure or not, like the loop the planner replaced."""
+    pack = _from_url(url)
+    while pack.parsed.hostname:
+        match _HOST_TO_URL_RESOLVER.get(pack.parsed.hostname):
+            case _Pure(resolve):
+                next_pack = await _as_coroutine(resolve, pack)
+            case _Network(_resolve, plan) if plan:
+                next_pack = await _as_coroutine(plan, pack)
+            case _:
+                break
+        if not next_pack or next_pack.url == pack.url:
+            break
+        pack = next_pack
+    return pack.url
+
+
+async def _as_coroutine[T](fn: Callable[[_Pack], T], pack: _Pack) -> T:
+    return fn(pack)
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
@@ -1,6 +1,8 @@
 import os
 from dataclasses import dataclass
 
+from bot.lib.fetch.limit import HostLimit
+
 
 @dataclass(frozen=True, kw_only=True)
 class Context:
@@ -19,6 +21,30 @@ class Context:
     duld_origin: str
     torrent_url: str
 
+    # persistent caches
+    cache_dir: str
+
+    # per-host upstream limits replacing the built-in ones, "*" for the rest
+    host_limits: dict[str, HostLimit]
+
+    # solve deadlines, in seconds
+    solve_timeout: float
+    solver_timeout: float
+    solver_timeouts: dict[str, float]
+
+    # lines of one message solved at the same time
+    max_line_workers: int
+    # reply in line order instead of as soon as possible
+    ordered_answers: bool
+    # seconds to collect answers into one reply, 0 to reply one by one
+    batch_window: float
+    # post a placeholder per line at once and edit it into the answer
+    progressive_replies: bool
+
+    # /api/v1/solve: longest wait per request, and requests solved at once
+    api_solve_timeout: float
+    max_api_solves: int
+
 
 def get_context(strict: bool = True):
     api_token = os.environ.get("API_TOKEN", "")
@@ -30,6 +56,17 @@ def get_context(strict: bool = True):
     dvd_origin = os.environ.get("DVD_ORIGIN", "")
     duld_origin = os.environ.get("DULD_ORIGIN", "")
     torrent_url = os.environ.get("TORRENT_URL", "")
+    cache_dir = os.environ.get("CACHE_DIR", "")
+    host_limits = os.environ.get("HOST_LIMITS", "")
+    solve_timeout = os.environ.get("SOLVE_TIMEOUT", "")
+    solver_timeout = os.environ.get("SOLVER_TIMEOUT", "")
+    solver_timeouts = os.environ.get("SOLVER_TIMEOUTS", "")
+    max_line_workers = os.environ.get("MAX_LINE_WORKERS", "")
+    ordered_answers = os.environ.get("ORDERED_ANSWERS", "")
+    batch_window = os.environ.get("BATCH_WINDOW", "")
+    progressive_replies = os.environ.get("PROGRESSIVE_REPLIES", "")
+    api_solve_timeout = os.environ.get("API_SOLVE_TIMEOUT", "")
+    max_api_solves = os.environ.get("MAX_API_SOLVES", "")
     if strict and not api_token:
         raise RuntimeError("`API_TOKEN` environment variable missing")
     return Context(
@@ -42,4 +79,36 @@ def get_context(strict: bool = True):
         dvd_origin=dvd_origin,
         duld_origin=duld_origin,
         torrent_url=torrent_url,
+        cache_dir=cache_dir,
+        host_limits=_parse_host_limits(host_limits),
+        solve_timeout=float(solve_timeout) if solve_timeout else 60,
+        solver_timeout=float(solver_timeout) if solver_timeout else 30,
+        solver_timeouts=_parse_timeouts(solver_timeouts),
+        max_line_workers=int(max_line_workers) if max_line_workers else 8,
+        ordered_answers=ordered_answers.lower() in ("1", "true", "yes"),
+        batch_window=float(batch_window) if batch_window else 0,
+        progressive_replies=progressive_replies.lower() in ("1", "true", "yes"),
+        api_solve_timeout=float(api_solve_timeout) if api_solve_timeout else 60,
+        max_api_solves=int(max_api_solves) if max_api_solves else 4,
     )
+
+
+def _parse_timeouts(raw: str) -> dict[str, float]:
+    """Parse `name=seconds` pairs separated by commas."""
+    timeouts: dict[str, float] = {}
+    for pair in filter(None, (_.strip() for _ in raw.split(","))):
+        name, _sep, seconds = pair.partition("=")
+        timeouts[name.strip()] = float(seconds)
+    return timeouts
+
+
+def _parse_host_limits(raw: str) -> dict[str, HostLimit]:
+    """Parse `host=concurrency/rate/burst` triples separated by commas."""
+    limits: dict[str, HostLimit] = {}
+    for pair in filter(None, (_.strip() for _ in raw.split(","))):
+        host, _sep, limit = pair.partition("=")
+        concurrency, rate, burst = limit.split("/")
+        limits[host.strip().lower()] = HostLimit(
+            concurrency=int(concurrency), rate=float(rate), burst=float(burst)
+        )
+    return limits
@@ -1,19 +1,34 @@
-from collections.abc import Awaitable, Callable
-from contextlib import asynccontextmanager
+import codecs
+import json
+import math
+from asyncio import Semaphore, timeout
+from collections.abc import AsyncIterator, Awaitable, Callable
+from contextlib import aclosing, asynccontextmanager
 from functools import partial, wraps
-from typing import Concatenate, TypedDict
+from typing import Any, Concatenate, NamedTuple, NotRequired, TypedDict
 
+from aiohttp import StreamReader
 from aiohttp.web import (
     AppKey,
     Application,
     AppRunner,
     Request,
     Response,
+    StreamResponse,
     TCPSite,
+    json_response,
+)
+from aiohttp.web_exceptions import (
+    HTTPBadRequest,
+    HTTPGatewayTimeout,
+    HTTPNoContent,
+    HTTPUnauthorized,
 )
-from aiohttp.web_exceptions import HTTPNoContent, HTTPUnauthorized
 
 from bot.context import Context
+from bot.handlers.lib import generate_answers
+from bot.processors.pipeline import create_multiple_solver, create_single_solver
+from bot.types.answer import Answer
 
 
 class TextData(TypedDict):
@@ -21,7 +36,14 @@ class TextData(TypedDict):
     text: str
 
 
+class SolveData(TypedDict):
+    text: str
+    # seconds, capped by the configured API_SOLVE_TIMEOUT
+    timeout: NotRequired[float]
+
+
 type EnqueueCallback = Callable[[int, str], Awaitable[None]]
+type SolveCallback = Callable[[str], AsyncIterator[Answer | None]]
 type WebhookCallback = Callable[[dict[str, object]], Awaitable[None]]
 
 
@@ -29,6 +51,12 @@ TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
 
 KEY_TOKEN = AppKey[str]("KEY_TOKEN")
 
+_NDJSON_TYPES = {"application/x-ndjson", "application/jsonl"}
+_READ_SIZE = 64 * 1024
+# A JSON array element still unparsed after this many characters is refused.
+_MAX_RECORD_SIZE = 1024 * 1024
+_NUMBER_CHARS = "0123456789+-.eE"
+
 
 @asynccontextmanager
 async def api_daemon(
@@ -39,6 +67,25 @@ async def api_daemon(
     app[KEY_TOKEN] = context.client_token
 
     app.router.add_route("POST", "/api/v1/text", partial(_handle_text, enqueue=enqueue))
+    app.router.add_route(
+        "POST", "/api/v1/texts", partial(_handle_texts, enqueue=enqueue)
+    )
+    app.router.add_route(
+        "POST",
+        "/api/v1/solve",
+        partial(
+            _handle_solve,
+            solve=partial(
+                generate_answers,
+                single_solve=create_single_solver(context),
+                multiple_solve=create_multiple_solver(context),
+                max_workers=context.max_line_workers,
+                ordered=context.ordered_answers,
+            ),
+            semaphore=Semaphore(context.max_api_solves),
+            max_timeout=context.api_solve_timeout,
+        ),
+    )
 
     if webhook and context.webhook_path:
         app.router.add_route(
@@ -55,13 +102,11 @@ async def api_daemon(
         await runner.cleanup()
 
 
-def _token_required[**P](
-    fn: Callable[Concatenate[Request, P], Awaitable[Response]],
-) -> Callable[Concatenate[Request, P], Awaitable[Response]]:
+def _token_required[**P, R: StreamResponse](
+    fn: Callable[Concatenate[Request, P], Awaitable[R]],
+) -> Callable[Concatenate[Request, P], Awaitable[R]]:
     @wraps(fn)
-    async def _assert_token(
-        request: Request, *args: P.args, **kwargs: P.kwargs
-    ) -> Response:
+    async def _assert_token(request: Request, *args: P.args, **kwargs: P.kwargs) -> R:
         if not _is_valid(request):
             raise HTTPUnauthorized()
         return await fn(request, *args, **kwargs)
@@ -77,9 +122,16 @@ def _is_valid(request: Request) -> bool:
     return answer == token
 
 
+async def _read_json(request: Request) -> Any:
+    try:
+        return await request.json()
+    except ValueError:
+        raise HTTPBadRequest(text="invalid JSON") from None
+
+
 @_token_required
 async def _handle_text(request: Request, *, enqueue: EnqueueCallback) -> Response:
-    data: TextData = await request.json()
+    data: TextData = await _read_json(request)
     chat_id = data["chat_id"]
     text = data["text"]
 
@@ -88,9 +140,225 @@ async def _handle_text(request: Request, *, enqueue: EnqueueCallback) -> Respons
     raise HTTPNoContent()
 
 
+@_token_required
+async def _handle_texts(
+    request: Request, *, enqueue: EnqueueCallback
+) -> StreamResponse:
+    """
+    Enqueue many texts in one request.
+
+    The body is either a JSON array of `TextData`, or with an NDJSON content
+    type, one `TextData` per line. Records are enqueued as they are parsed,
+    and the response streams one NDJSON line per record, in order:
+    `{"index": 0, "accepted": true}`, or `"accepted": false` with an
+    `"error"`. A malformed array ends the stream with a final rejection.
+    """
+    if request.content_type in _NDJSON_TYPES:
+        records = _iter_ndjson(request.content)
+    else:
+        records = _iter_json_array(request.content)
+
+    response = StreamResponse()
+    response.content_type = "application/x-ndjson"
+    await response.prepare(request)
+
+    index = 0
+    try:
+        async for record in records:
+            match _to_text_data(record):
+                case _Rejected(error=error):
+                    await _write_result(response, index, error=error)
+                case data:
+                    await enqueue(data["chat_id"], data["text"])
+                    await _write_result(response, index)
+            index += 1
+    except ValueError as e:
+        await _write_result(response, index, error=str(e))
+
+    await response.write_eof()
+    return response
+
+
+class _Rejected(NamedTuple):
+    error: str
+
+
+async def _iter_ndjson(content: StreamReader) -> AsyncIterator[object]:
+    """One record per non-empty line; bad lines are rejected on their own."""
+    async for raw_line in _iter_lines(content):
+        if raw_line is None:
+            yield _Rejected("record too large")
+            continue
+        line = raw_line.strip()
+        if not line:
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError:
+            yield _Rejected("invalid JSON")
+
+
+async def _iter_lines(content: StreamReader) -> AsyncIterator[bytes | None]:
+    """
+    Split the body into lines, keeping at most `_MAX_RECORD_SIZE` bytes.
+
+    A longer line is skipped up to its end and yields None instead.
+    """
+    buffer = bytearray()
+    # Inside a line already known to be too long.
+    oversized = False
+    async for chunk in content.iter_chunked(_READ_SIZE):
+        start = 0
+        while (end := chunk.find(b"\n", start)) >= 0:
+            if not oversized:
+                buffer += chunk[start:end]
+            if oversized or len(buffer) > _MAX_RECORD_SIZE:
+                yield None
+            else:
+                yield bytes(buffer)
+            buffer.clear()
+            oversized = False
+            start = end + 1
+        if not oversized:
+            buffer += chunk[start:]
+            if len(buffer) > _MAX_RECORD_SIZE:
+                oversized = True
+                buffer.clear()
+    if oversized:
+        yield None
+    elif buffer:
+        yield bytes(buffer)
+
+
+async def _iter_json_array(content: StreamReader) -> AsyncIterator[object]:
+    """
+    Parse the elements of a JSON array as they arrive.
+
+    Only the element being parsed is kept in memory. Raises ValueError if
+    the body is not a well-formed array.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    position = 0
+    at_eof = False
+    # What may come next: "[" first, then a value or "]", then "," or "]".
+    expecting = "["
+
+    while True:
+        while position < len(buffer) and buffer[position].isspace():
+            position += 1
+        if position >= len(buffer):
+            if at_eof:
+                raise ValueError("unexpected end of JSON array")
+            buffer = buffer[position:]
+            position = 0
+            chunk = await content.read(_READ_SIZE)
+            at_eof = not chunk
+            buffer += text_decoder.decode(chunk, final=at_eof)
+            continue
+
+        char = buffer[position]
+        if expecting == "[":
+            if char != "[":
+                raise ValueError("expected a JSON array")
+            position += 1
+            expecting = "value"
+        elif char == "]" and expecting != "next value":
+            return
+        elif expecting == "separator":
+            if char != ",":
+                raise ValueError("expected ',' or ']'")
+            position += 1
+            expecting = "next value"
+        else:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # A number cut short by the chunk boundary still parses, as
+                # its prefix; only trust it once something else follows.
+                complete = at_eof or bool(buffer[end:].lstrip(_NUMBER_CHARS))
+            except json.JSONDecodeError:
+                if at_eof:
+                    raise ValueError("invalid JSON") from None
+                complete = False
+            if not complete:
+                # Maybe just incomplete; read on until the end of the body.
+                if len(buffer) - position > _MAX_RECORD_SIZE:
+                    raise ValueError("record too large or invalid JSON")
+                chunk = await content.read(_READ_SIZE)
+                at_eof = not chunk
+                buffer = buffer[position:] + text_decoder.decode(chunk, final=at_eof)
+                position = 0
+                continue
+            position = end
+            expecting = "separator"
+            yield value
+
+
+def _to_text_data(record: object) -> TextData | _Rejected:
+    if isinstance(record, _Rejected):
+        return record
+    if not isinstance(record, dict):
+        return _Rejected("expected an object")
+    chat_id = record.get("chat_id")
+    text = record.get("text")
+    if not isinstance(chat_id, int) or isinstance(chat_id, bool):
+        return _Rejected("chat_id must be an integer")
+    if not isinstance(text, str):
+        return _Rejected("text must be a string")
+    return TextData(chat_id=chat_id, text=text)
+
+
+async def _write_result(
+    response: StreamResponse, index: int, *, error: str | None = None
+) -> None:
+    result: dict[str, object] = {"index": index, "accepted": error is None}
+    if error is not None:
+        result["error"] = error
+    await response.write(json.dumps(result).encode("utf-8") + b"\n")
+
+
+@_token_required
+async def _handle_solve(
+    request: Request,
+    *,
+    solve: SolveCallback,
+    semaphore: Semaphore,
+    max_timeout: float,
+) -> Response:
+    """
+    Solve the text right away and respond with the answers, without Telegram.
+
+    Waiting for a free slot counts towards the timeout.
+    """
+    data: SolveData = await _read_json(request)
+    if not isinstance(data, dict):
+        raise HTTPBadRequest(text="expected an object")
+    text = data.get("text")
+    if not isinstance(text, str):
+        raise HTTPBadRequest(text="text must be a string")
+    seconds = data.get("timeout", max_timeout)
+    if (
+        not isinstance(seconds, (int, float))
+        or isinstance(seconds, bool)
+        or not 0 < seconds < math.inf
+    ):
+        raise HTTPBadRequest(text="timeout must be a positive number")
+    seconds = min(seconds, max_timeout)
+
+    try:
+        async with timeout(seconds), semaphore:
+            async with aclosing(solve(text)) as answers:
+                result = [answer.to_dict() async for answer in answers if answer]
+    except TimeoutError:
+        raise HTTPGatewayTimeout()
+
+    return json_response(result)
+
+
 @_token_required
 async def _handle_webhook(request: Request, *, webhook: WebhookCallback) -> Response:
-    data: dict[str, object] = await request.json()
+    data: dict[str, object] = await _read_json(request)
 
     await webhook(data)
 
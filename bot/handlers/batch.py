@@ -0,0 +1,151 @@
+from asyncio import Task, ensure_future, get_running_loop, wait
+from collections.abc import AsyncIterator
+from dataclasses import dataclass
+from typing import Self
+
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, LinkPreviewOptions
+from telegram.constants import InlineKeyboardMarkupLimit, MessageLimit
+
+from bot.types.answer import Answer
+
+
+_MAX_TEXT_LENGTH = MessageLimit.MAX_TEXT_LENGTH
+_MAX_BUTTONS = InlineKeyboardMarkupLimit.TOTAL_BUTTON_NUMBER
+
+
+@dataclass(frozen=True, kw_only=True)
+class Reply:
+    """What goes into one Telegram message: one answer, or several merged."""
+
+    html_text: str
+    keyboard: InlineKeyboardMarkup | None = None
+    link_preview: LinkPreviewOptions | None = None
+
+    @classmethod
+    def from_answer(cls, answer: Answer) -> Self:
+        return cls(
+            html_text=answer.html_text,
+            keyboard=answer.keyboard,
+            link_preview=answer.link_preview,
+        )
+
+
+async def batch_answers(
+    answers: AsyncIterator[Answer | None], /, *, window: float
+) -> AsyncIterator[Reply | None]:
+    """
+    Pack consecutive answers into as few replies as Telegram allows.
+
+    A batch is sent once the next answer would not fit in one message, or
+    `window` seconds after its first answer arrived. None, for an input
+    without an answer, passes straight through.
+    With a `window` of zero or less every answer is a reply of its own.
+    """
+    if window <= 0:
+        async for answer in answers:
+            yield Reply.from_answer(answer) if answer else None
+        return
+
+    loop = get_running_loop()
+    batch = _Batch()
+    deadline = 0.0
+    next_answer: Task[Answer | None] | None = None
+    try:
+        while True:
+            if not next_answer:
+                next_answer = ensure_future(anext(answers))
+            timeout = max(deadline - loop.time(), 0) if batch else None
+            done, _pending = await wait({next_answer}, timeout=timeout)
+            if not done:
+                yield batch.flush()
+                continue
+
+            task, next_answer = next_answer, None
+            try:
+                answer = task.result()
+            except StopAsyncIteration:
+                break
+            if not answer:
+                yield None
+                continue
+
+            if batch and not batch.fits(answer):
+                yield batch.flush()
+            if not batch:
+                deadline = loop.time() + window
+            batch.add(answer)
+
+        if batch:
+            yield batch.flush()
+    finally:
+        if next_answer:
+            next_answer.cancel()
+
+
+class _Batch:
+    def __init__(self) -> None:
+        self._answers: list[Answer] = []
+        self._text_length = 0
+        self._button_count = 0
+
+    def __bool__(self) -> bool:
+        return bool(self._answers)
+
+    def fits(self, answer: Answer) -> bool:
+        index = len(self._answers) + 1
+        text_length = self._text_length + len(_numbered(index, answer)) + 1
+        button_count = self._button_count + _count_buttons(answer)
+        return text_length <= _MAX_TEXT_LENGTH and button_count <= _MAX_BUTTONS
+
+    def add(self, answer: Answer) -> None:
+        index = len(self._answers) + 1
+        self._answers.append(answer)
+        self._text_length += len(_numbered(index, answer)) + 1
+        self._button_count += _count_buttons(answer)
+
+    def flush(self) -> Reply:
+        answers = self._answers
+        self._answers = []
+        self._text_length = 0
+        self._button_count = 0
+
+        if len(answers) == 1:
+            return Reply.from_answer(answers[0])
+        return Reply(
+            html_text="\n".join(_numbered(i, _) for i, _ in enumerate(answers, 1)),
+            keyboard=_merge_keyboards(answers),
+            link_preview=next(
+                (_.link_preview for _ in answers if _.link_preview), None
+            ),
+        )
+
+
+def _numbered(index: int, answer: Answer) -> str:
+    return f"{index}. {answer.html_text}"
+
+
+def _count_buttons(answer: Answer) -> int:
+    if not answer.keyboard:
+        return 0
+    return sum(len(row) for row in answer.keyboard.inline_keyboard)
+
+
+def _merge_keyboards(answers: list[Answer]) -> InlineKeyboardMarkup | None:
+    """Stack every answer's rows, labelling buttons with the answer number."""
+    rows: list[list[InlineKeyboardButton]] = []
+    for index, answer in enumerate(answers, 1):
+        if not answer.keyboard:
+            continue
+        for row in answer.keyboard.inline_keyboard:
+            if row:
+                rows.append([_label_button(index, _) for _ in row])
+    return InlineKeyboardMarkup(rows) if rows else None
+
+
+def _label_button(index: int, button: InlineKeyboardButton) -> InlineKeyboardButton:
+    data = button.to_dict()
+    data["text"] = f"{index}. {button.text}"
+    labelled = InlineKeyboardButton.de_json(data)
+    if not labelled:
+        raise ValueError("failed to copy keyboard button")
+    return labelled
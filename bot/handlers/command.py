@@ -14,7 +14,8 @@ async def handle_chat_id(update: Update, _context: ContextTypes.DEFAULT_TYPE) ->
         lambda: message.reply_markdown_v2(
             f"`{message.chat_id}`",
             reply_parameters=ReplyParameters(message_id=message.id),
-        )
+        ),
+        chat_id=message.chat_id,
     )
 
 
@@ -1,48 +1,47 @@
 import plistlib
-from asyncio import as_completed
-from collections.abc import AsyncIterator, Awaitable, Callable
+from asyncio import FIRST_COMPLETED, Task, create_task, wait
+from collections.abc import AsyncIterator, Awaitable, Callable, Iterator
+from contextlib import aclosing
+from io import StringIO
+from itertools import islice
 from logging import getLogger
-from typing import Any
-
-from telegram.error import TimedOut
+from typing import Any, NamedTuple
 
+from bot.lib.outbound import OutboundScheduler, get_outbound_scheduler
 from bot.lib.url import maybe_resolve_url
 from bot.types.answer import Answer, Solver
 
 
 _L = getLogger(__name__)
+# How many times max_workers lines ordered mode may start ahead.
+_REORDER_WINDOW = 4
 
 
 async def retry_on_timeout[T](
-    coro_factory: Callable[[], Awaitable[T]], *, max_retries: int = 3
+    coro_factory: Callable[[], Awaitable[T]],
+    *,
+    chat_id: int | None = None,
+    max_retries: int = 3,
 ) -> T:
     """
-    Retry an async operation on TimeOut exception.
+    Send a Telegram request through the outbound scheduler, with retries.
 
     Args:
         coro_factory: A callable that returns an awaitable (coroutine factory)
+        chat_id: The chat the request goes to, for per-chat pacing
         max_retries: Maximum number of retry attempts (default: 3, meaning initial + 2 retries)
 
     Returns:
         The result of the awaitable
 
     Raises:
-        TimedOut: If all retry attempts are exhausted
+        NetworkError: If all retry attempts are exhausted, e.g. TimedOut
+        RetryAfter: If flood control keeps rejecting the request
         Any other exception raised by the awaitable
     """
-    for attempt in range(max_retries):
-        try:
-            return await coro_factory()
-        except TimedOut:
-            if attempt < max_retries - 1:
-                _L.warning(
-                    f"Telegram TimeOut on attempt {attempt + 1}/{max_retries}, retrying..."
-                )
-            else:
-                _L.error(f"Telegram TimeOut after {max_retries} attempts, giving up")
-                raise
-
-    raise RuntimeError("unreachable code in retry_on_timeout")
+    # Without a running scheduler, still retry, just without shared pacing.
+    scheduler = get_outbound_scheduler() or OutboundScheduler()
+    return await scheduler.send(chat_id, coro_factory, max_retries=max_retries)
 
 
 def parse_plist(unknown_text: str) -> Any:
@@ -56,21 +55,136 @@ def parse_plist(unknown_text: str) -> Any:
 
 
 async def generate_answers(
-    unknown_text: str, /, *, single_solve: Solver, multiple_solve: Solver
+    unknown_text: str,
+    /,
+    *,
+    single_solve: Solver,
+    multiple_solve: Solver,
+    max_workers: int,
+    ordered: bool = False,
 ) -> AsyncIterator[Answer | None]:
+    """
+    Solve the text as a whole, or else line by line.
+
+    At most `max_workers` lines are in flight at once; more lines are only
+    read as earlier ones finish. Answers come in completion order, or with
+    `ordered`, in line order: each answer is yielded once it and every line
+    before it are done, and at most `_REORDER_WINDOW` times `max_workers`
+    lines are started ahead of the first unfinished one.
+
+    Repeated lines, and lines resolving to the same URL, are solved and
+    answered once.
+    """
     if answer := await multiple_solve(unknown_text):
         yield answer
         return
-    lines = unknown_text.splitlines()
-    normalized_lines = filter(None, (_.strip() for _ in lines))
-    producers = (_get_answer(_, single_solve) for _ in normalized_lines)
-    for consumer in as_completed(producers):
-        yield await consumer
 
+    line_answers = generate_line_answers(
+        unknown_text,
+        single_solve=single_solve,
+        max_workers=max_workers,
+        ordered=ordered,
+    )
+    async with aclosing(line_answers):
+        async for line_answer in line_answers:
+            if not line_answer.duplicate:
+                yield line_answer.answer
+
+
+class LineAnswer(NamedTuple):
+    index: int
+    line: str
+    answer: Answer | None
+    # Another line already resolved to the same input.
+    duplicate: bool = False
+
+
+async def generate_line_answers(
+    unknown_text: str,
+    /,
+    *,
+    single_solve: Solver,
+    max_workers: int,
+    ordered: bool = False,
+    on_start: Callable[[str], None] | None = None,
+) -> AsyncIterator[LineAnswer]:
+    """
+    Solve the text line by line, as described in generate_answers.
+
+    Every unique line is yielded once, including those collapsed into an
+    earlier one. `on_start`, if given, is called with each line as it
+    takes a worker; it must not block, so the worker is not held up.
+    """
+    lines = enumerate(_iter_unique_lines(unknown_text))
+    window = max_workers * _REORDER_WINDOW if ordered else None
+    # Resolved inputs already taken by some line.
+    targets: set[str] = set()
+    pending: set[Task[LineAnswer]] = set()
+    # Results waiting for an earlier line, by line index.
+    finished: dict[int, LineAnswer] = {}
+    started = 0
+    emitted = 0
+    try:
+        while True:
+            room = max_workers - len(pending)
+            if window:
+                room = min(room, window - (started - emitted))
+            for index, line in islice(lines, max(room, 0)):
+                if on_start:
+                    on_start(line)
+                task = create_task(_solve_line(index, line, single_solve, targets))
+                pending.add(task)
+                started += 1
+            if not pending:
+                return
+
+            done, pending = await wait(pending, return_when=FIRST_COMPLETED)
+            for task in done:
+                result = task.result()
+                if not ordered:
+                    emitted += 1
+                    yield result
+                    continue
+                finished[result.index] = result
+                while emitted in finished:
+                    result = finished.pop(emitted)
+                    emitted += 1
+                    yield result
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def _iter_unique_lines(unknown_text: str) -> Iterator[str]:
+    """Stripped non-empty lines, read lazily, each only the first time."""
+    seen: set[str] = set()
+    for line in StringIO(unknown_text, newline=None):
+        stripped = line.strip()
+        if stripped and stripped not in seen:
+            seen.add(stripped)
+            yield stripped
+
+
+async def _solve_line(
+    index: int,
+    line: str,
+    solve: Solver,
+    targets: set[str],
+) -> LineAnswer:
+    try:
+        resolved = await maybe_resolve_url(line)
+    except Exception:
+        _L.exception(f"error while resolving {line}")
+        return LineAnswer(index=index, line=line, answer=None)
+    if resolved in targets:
+        _L.debug(f"duplicate of an earlier line: {line}")
+        return LineAnswer(index=index, line=line, answer=None, duplicate=True)
+    targets.add(resolved)
+    answer = await _get_answer(resolved, solve)
+    return LineAnswer(index=index, line=line, answer=answer)
 
-async def _get_answer(unknown_text: str, solve: Solver) -> Answer | None:
-    unknown_text = await maybe_resolve_url(unknown_text)
 
+async def _get_answer(unknown_text: str, solve: Solver) -> Answer | None:
     try:
         answer = await solve(unknown_text)
     except Exception:
@@ -1,14 +1,16 @@
 from functools import partial
 from logging import getLogger
 
-from telegram import Update
+from telegram import Message, Update
 from telegram.ext import ContextTypes, MessageHandler, filters
 
 from bot.context import Context
 from bot.processors.pipeline import create_multiple_solver, create_single_solver
 from bot.types.answer import Solver
 
+from .batch import Reply, batch_answers
 from .lib import generate_answers, retry_on_timeout
+from .progressive import reply_progressively
 
 
 _L = getLogger(__name__)
@@ -20,6 +22,10 @@ async def _dispatch_text_message(
     *,
     single_solve: Solver,
     multiple_solve: Solver,
+    max_workers: int,
+    ordered: bool,
+    batch_window: float,
+    progressive: bool,
 ) -> None:
     if not update.message:
         _L.warning("no update.message")
@@ -31,34 +37,63 @@ async def _dispatch_text_message(
         _L.warning("no update.message.text")
         return
 
+    if progressive:
+        ok = await reply_progressively(
+            unknown_text,
+            send=partial(_reply, message),
+            chat_id=message.chat_id,
+            single_solve=single_solve,
+            multiple_solve=multiple_solve,
+            max_workers=max_workers,
+            ordered=ordered,
+        )
+        if ok:
+            await retry_on_timeout(
+                lambda: context.bot.delete_message(message.chat.id, message.id),
+                chat_id=message.chat.id,
+            )
+        return
+
     ok = True
-    async for answer in generate_answers(
-        unknown_text, single_solve=single_solve, multiple_solve=multiple_solve
-    ):
-        if not answer:
+    answers = generate_answers(
+        unknown_text,
+        single_solve=single_solve,
+        multiple_solve=multiple_solve,
+        max_workers=max_workers,
+        ordered=ordered,
+    )
+    async for reply in batch_answers(answers, window=batch_window):
+        if not reply:
             ok = False
             continue
 
-        html_text = answer.html_text
-        keyboard = answer.keyboard
-        link_preview = answer.link_preview
+        await retry_on_timeout(partial(_reply, message, reply), chat_id=message.chat_id)
 
+    if ok:
         await retry_on_timeout(
-            lambda: message.reply_html(
-                html_text,
-                reply_markup=keyboard,
-                link_preview_options=link_preview,
-            )
+            lambda: context.bot.delete_message(message.chat.id, message.id),
+            chat_id=message.chat.id,
         )
 
-    if ok:
-        await context.bot.delete_message(message.chat.id, message.id)
+
+async def _reply(message: Message, reply: Reply) -> Message:
+    return await message.reply_html(
+        reply.html_text,
+        reply_markup=reply.keyboard,
+        link_preview_options=reply.link_preview,
+    )
 
 
 def create_message_handler(context: Context):
     single_solve = create_single_solver(context)
     multiple_solve = create_multiple_solver(context)
     text_solver = partial(
-        _dispatch_text_message, single_solve=single_solve, multiple_solve=multiple_solve
+        _dispatch_text_message,
+        single_solve=single_solve,
+        multiple_solve=multiple_solve,
+        max_workers=context.max_line_workers,
+        ordered=context.ordered_answers,
+        batch_window=context.batch_window,
+        progressive=context.progressive_replies,
     )
     return MessageHandler(filters.TEXT & ~filters.COMMAND, text_solver)
@@ -0,0 +1,146 @@
+from asyncio import Task, create_task, gather
+from collections.abc import Awaitable, Callable
+from contextlib import aclosing
+from html import escape
+from logging import getLogger
+
+from telegram import LinkPreviewOptions, Message
+from telegram.constants import ParseMode
+
+from bot.types.answer import Solver
+
+from .batch import Reply
+from .lib import LineAnswer, generate_line_answers, retry_on_timeout
+
+
+type SendReply = Callable[[Reply], Awaitable[Message]]
+
+
+_L = getLogger(__name__)
+
+
+async def reply_progressively(
+    unknown_text: str,
+    /,
+    *,
+    send: SendReply,
+    chat_id: int,
+    single_solve: Solver,
+    multiple_solve: Solver,
+    max_workers: int,
+    ordered: bool,
+) -> bool:
+    """
+    Post a placeholder for every line as it starts, then edit it into the
+    answer once solved. Placeholders of lines without an answer are removed.
+
+    Returns whether every line got an answer.
+    """
+    if answer := await multiple_solve(unknown_text):
+        reply = Reply.from_answer(answer)
+        await retry_on_timeout(lambda: send(reply), chat_id=chat_id)
+        return True
+
+    # Placeholder posts by line, from when the line starts until it is done.
+    # They run on their own, so Telegram's pace does not hold up solving.
+    placeholders: dict[str, Task[Message | None]] = {}
+
+    def post_placeholder(line: str) -> None:
+        placeholders[line] = create_task(_post_placeholder(line, send, chat_id))
+
+    ok = True
+    line_answers = generate_line_answers(
+        unknown_text,
+        single_solve=single_solve,
+        max_workers=max_workers,
+        ordered=ordered,
+        on_start=post_placeholder,
+    )
+    # Each line is finished on its own too, so the next lines start right away.
+    finishing: list[Task[None]] = []
+    try:
+        async with aclosing(line_answers):
+            async for line_answer in line_answers:
+                if not line_answer.answer:
+                    ok = ok and line_answer.duplicate
+                posting = placeholders.pop(line_answer.line, None)
+                finishing.append(
+                    create_task(_finish(line_answer, posting, send, chat_id))
+                )
+    finally:
+        results = await gather(*finishing, return_exceptions=True)
+        # Do not leave anything stuck on the placeholder if solving broke off.
+        for placeholder in await gather(*placeholders.values()):
+            if placeholder:
+                await _delete(placeholder, chat_id)
+
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return ok
+
+
+async def _finish(
+    line_answer: LineAnswer,
+    posting: Task[Message | None] | None,
+    send: SendReply,
+    chat_id: int,
+) -> None:
+    """Edit the line's placeholder into its answer, or remove it."""
+    placeholder = await posting if posting else None
+    if not line_answer.answer:
+        if placeholder:
+            await _delete(placeholder, chat_id)
+        return
+
+    reply = Reply.from_answer(line_answer.answer)
+    if placeholder and await _edit(placeholder, reply, chat_id):
+        return
+    try:
+        await retry_on_timeout(lambda: send(reply), chat_id=chat_id)
+    finally:
+        if placeholder:
+            await _delete(placeholder, chat_id)
+
+
+async def _post_placeholder(line: str, send: SendReply, chat_id: int) -> Message | None:
+    reply = _make_placeholder(line)
+    try:
+        return await retry_on_timeout(lambda: send(reply), chat_id=chat_id)
+    except Exception:
+        # The answer will be sent as a new message instead.
+        _L.exception(f"failed to post placeholder for {line}")
+        return None
+
+
+def _make_placeholder(line: str) -> Reply:
+    return Reply(
+        html_text=f"⏳ <code>{escape(line)}</code>",
+        link_preview=LinkPreviewOptions(is_disabled=True),
+    )
+
+
+async def _delete(message: Message, chat_id: int) -> None:
+    try:
+        await retry_on_timeout(message.delete, chat_id=chat_id)
+    except Exception:
+        _L.exception("failed to delete placeholder")
+
+
+async def _edit(message: Message, reply: Reply, chat_id: int) -> bool:
+    """Edit the placeholder into the reply; False if that did not work."""
+    try:
+        await retry_on_timeout(
+            lambda: message.edit_text(
+                reply.html_text,
+                parse_mode=ParseMode.HTML,
+                reply_markup=reply.keyboard,
+                link_preview_options=reply.link_preview,
+            ),
+            chat_id=chat_id,
+        )
+    except Exception:
+        # E.g. the placeholder was deleted meanwhile.
+        _L.exception("failed to edit placeholder")
+        return False
+    return True
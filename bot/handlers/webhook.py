@@ -3,6 +3,7 @@ from dataclasses import dataclass
 from functools import partial
 from logging import getLogger
 
+from telegram import Bot, Message
 from telegram.constants import ParseMode
 from telegram.ext import ContextTypes, TypeHandler
 
@@ -10,7 +11,9 @@ from bot.context import Context
 from bot.processors.pipeline import create_multiple_solver, create_single_solver
 from bot.types.answer import Solver
 
+from .batch import Reply, batch_answers
 from .lib import generate_answers, parse_plist, retry_on_timeout
+from .progressive import reply_progressively
 
 
 @dataclass
@@ -28,6 +31,10 @@ async def _solve_api_text(
     *,
     single_solve: Solver,
     multiple_solve: Solver,
+    max_workers: int,
+    ordered: bool,
+    batch_window: float,
+    progressive: bool,
 ) -> None:
     unknown_text = update.text
     if not unknown_text:
@@ -41,25 +48,41 @@ async def _solve_api_text(
         _L.debug(f"got plist: {plist}")
         return
 
-    async for answer in generate_answers(
-        update.text, single_solve=single_solve, multiple_solve=multiple_solve
-    ):
-        if not answer:
+    send = partial(_send, context.bot, update.chat_id)
+    if progressive:
+        await reply_progressively(
+            update.text,
+            send=send,
+            chat_id=update.chat_id,
+            single_solve=single_solve,
+            multiple_solve=multiple_solve,
+            max_workers=max_workers,
+            ordered=ordered,
+        )
+        return
+
+    answers = generate_answers(
+        update.text,
+        single_solve=single_solve,
+        multiple_solve=multiple_solve,
+        max_workers=max_workers,
+        ordered=ordered,
+    )
+    async for reply in batch_answers(answers, window=batch_window):
+        if not reply:
             continue
 
-        html_text = answer.html_text
-        keyboard = answer.keyboard
-        link_preview = answer.link_preview
-
-        await retry_on_timeout(
-            lambda: context.bot.send_message(
-                update.chat_id,
-                html_text,
-                parse_mode=ParseMode.HTML,
-                reply_markup=keyboard,
-                link_preview_options=link_preview,
-            )
-        )
+        await retry_on_timeout(partial(send, reply), chat_id=update.chat_id)
+
+
+async def _send(bot: Bot, chat_id: int, reply: Reply) -> Message:
+    return await bot.send_message(
+        chat_id,
+        reply.html_text,
+        parse_mode=ParseMode.HTML,
+        reply_markup=reply.keyboard,
+        link_preview_options=reply.link_preview,
+    )
 
 
 async def enqueue_update(*, chat_id: int, text: str, queue: Queue[object]) -> None:
@@ -72,6 +95,12 @@ def create_webhook_handler(context: Context):
     return TypeHandler(
         type=ApiTextUpdate,
         callback=partial(
-            _solve_api_text, single_solve=single_solve, multiple_solve=multiple_solve
+            _solve_api_text,
+            single_solve=single_solve,
+            multiple_solve=multiple_solve,
+            max_workers=context.max_line_workers,
+            ordered=context.ordered_answers,
+            batch_window=context.batch_window,
+            progressive=context.progressive_replies,
         ),
     )
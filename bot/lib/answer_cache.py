@@ -0,0 +1,81 @@
+from contextlib import asynccontextmanager
+from logging import getLogger
+from typing import Any
+
+from bot.lib.cache import TtlLruCache
+from bot.types.answer import Answer
+
+
+_MAX_ENTRIES = 10_000
+_TTL = 24 * 60 * 60
+_NEGATIVE_TTL = 10 * 60
+
+
+_L = getLogger(__name__)
+
+
+type AnswerKey = tuple[str, str]
+
+
+class AnswerCache:
+    """
+    Remember what solvers answered for an input.
+
+    Answers are kept as `Answer.to_dict()` data and rebuilt on every hit, so
+    callers never share keyboard objects. Inputs without an answer are
+    remembered for a shorter while.
+    """
+
+    def __init__(self, *, max_entries: int, ttl: float, negative_ttl: float) -> None:
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._answers = TtlLruCache[AnswerKey, dict[str, Any]](max_size=max_entries)
+        self._unanswered = TtlLruCache[AnswerKey, bool](max_size=max_entries)
+
+    @property
+    def hits(self) -> int:
+        return self._answers.hits
+
+    @property
+    def misses(self) -> int:
+        return self._answers.misses
+
+    def get(self, key: AnswerKey) -> Answer | None:
+        data = self._answers.get(key)
+        return Answer.from_dict(data) if data else None
+
+    def has_no_answer(self, key: AnswerKey) -> bool:
+        return bool(self._unanswered.get(key))
+
+    def remember(self, key: AnswerKey, answer: Answer | None) -> None:
+        if answer:
+            self._answers.put(key, answer.to_dict(), ttl=self._ttl)
+            self._unanswered.pop(key)
+        else:
+            self._unanswered.put(key, True, ttl=self._negative_ttl)
+
+
+_cache: AnswerCache | None = None
+
+
+def get_answer_cache() -> AnswerCache | None:
+    return _cache
+
+
+@asynccontextmanager
+async def answer_cache_context(
+    *,
+    max_entries: int = _MAX_ENTRIES,
+    ttl: float = _TTL,
+    negative_ttl: float = _NEGATIVE_TTL,
+):
+    """Enable the answer cache for the pipeline solvers."""
+    global _cache
+
+    cache = AnswerCache(max_entries=max_entries, ttl=ttl, negative_ttl=negative_ttl)
+    _cache = cache
+    try:
+        yield cache
+    finally:
+        _cache = None
+        _L.info(f"answer cache: {cache.hits} hits, {cache.misses} misses")
@@ -0,0 +1,102 @@
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Hashable
+from dataclasses import dataclass
+
+
+@dataclass(frozen=True, kw_only=True)
+class _Entry[V]:
+    value: V
+    size: int
+    expires_at: float
+
+
+def _count_one(_value: object) -> int:
+    return 1
+
+
+class TtlLruCache[K: Hashable, V]:
+    """
+    LRU mapping where every entry also expires after its own TTL.
+
+    `max_size` is measured with `sizeof`, which counts entries by default;
+    pass a byte counter to get a memory budget instead.
+    """
+
+    def __init__(
+        self,
+        *,
+        max_size: int,
+        sizeof: Callable[[V], int] = _count_one,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self._max_size = max_size
+        self._sizeof = sizeof
+        self._clock = clock
+        self._entries: OrderedDict[K, _Entry[V]] = OrderedDict()
+        self._size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    def get(self, key: K) -> V | None:
+        entry = self._entries.get(key)
+        if not entry:
+            self.misses += 1
+            return None
+
+        if entry.expires_at <= self._clock():
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry.value
+
+    def put(self, key: K, value: V, *, ttl: float) -> None:
+        if ttl <= 0:
+            return
+
+        size = self._sizeof(value)
+        if size > self._max_size:
+            return
+
+        if key in self._entries:
+            self._remove(key)
+
+        self._entries[key] = _Entry(
+            value=value, size=size, expires_at=self._clock() + ttl
+        )
+        self._size += size
+
+        while self._size > self._max_size:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def items(self) -> list[tuple[K, V, float]]:
+        """Unexpired entries with their expiry time, oldest first."""
+        now = self._clock()
+        return [
+            (key, entry.value, entry.expires_at)
+            for key, entry in self._entries.items()
+            if entry.expires_at > now
+        ]
+
+    def pop(self, key: K) -> None:
+        if key in self._entries:
+            self._remove(key)
+
+    def clear(self) -> None:
+        self._entries.clear()
+        self._size = 0
+
+    def _remove(self, key: K) -> None:
+        entry = self._entries.pop(key)
+        self._size -= entry.size
@@ -1 +1,24 @@
-# Empty init file for package
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from .limit import HostLimit, limit_context
+
+
+@asynccontextmanager
+async def fetch_context(
+    *, cache_dir: str = "", host_limits: Mapping[str, HostLimit] | None = None
+):
+    """Keep pooled HTTP sessions and caches alive for the lifetime of the caller."""
+    from .aio import session_context as aio_context
+    from .cache import cache_context
+    from .curl import session_context as curl_context
+
+    disk_path = Path(cache_dir) / "http.sqlite" if cache_dir else None
+    with cache_context(disk_path=disk_path):
+        async with (
+            limit_context(overrides=host_limits),
+            aio_context(),
+            curl_context(),
+        ):
+            yield
@@ -1,23 +1,75 @@
 """aiohttp-based fetch implementation."""
 
+import json
 from contextlib import asynccontextmanager
 from typing import Any
 
-from aiohttp import ClientSession
+from aiohttp import ClientSession, DummyCookieJar, TCPConnector
 from bs4 import BeautifulSoup
 
+from bot.lib.singleflight import SingleFlight
 from bot.types.json import JsonDict
 
+from .cache import CachedBody, CacheKey, cached_get, fetch_fresh, make_key
+from .limit import throttle
+from .parser import DEFAULT_PARSER, HtmlParser
+from .stream import MAX_STREAM_BYTES, EarlyExit, StopAt
+
+
+# Connection pool settings for the shared session.
+_POOL_LIMIT = 100
+_POOL_LIMIT_PER_HOST = 8
+_DNS_CACHE_TTL = 300
+_KEEPALIVE_TIMEOUT = 30
+_CHUNK_SIZE = 16 * 1024
+
+_session: ClientSession | None = None
+_inflight = SingleFlight[CacheKey, CachedBody]()
+
+
+@asynccontextmanager
+async def session_context():
+    """Keep a pooled ClientSession alive for all fetch helpers."""
+    global _session
+
+    connector = TCPConnector(
+        limit=_POOL_LIMIT,
+        limit_per_host=_POOL_LIMIT_PER_HOST,
+        ttl_dns_cache=_DNS_CACHE_TTL,
+        keepalive_timeout=_KEEPALIVE_TIMEOUT,
+    )
+    # Cookies set by one fetch must not leak into unrelated later ones.
+    async with ClientSession(
+        connector=connector, cookie_jar=DummyCookieJar()
+    ) as session:
+        _session = session
+        try:
+            yield session
+        finally:
+            _session = None
+
+
+@asynccontextmanager
+async def client_session():
+    """Borrow the pooled session, or open a one-shot session if there is none."""
+    if _session and not _session.closed:
+        yield _session
+        return
+
+    async with ClientSession() as session:
+        yield session
+
 
 async def get_json(
     url: str,
     *,
     queries: dict[str, str] | None = None,
     headers: list[tuple[str, str]] | None = None,
+    cache: bool = False,
 ) -> Any:
     """Get JSON response from URL."""
-    async with _http_get(url, queries=queries, headers=headers) as response:
-        return await response.json()
+    body = await _get_body(url, queries=queries, headers=headers, cache=cache)
+    return json.loads(body.text)
 
 
 async def get_html(
@@ -25,11 +77,26 @@ async def get_html(
     *,
     cookies: dict[str, str] | None = None,
     headers: list[tuple[str, str]] | None = None,
+    cache: bool = False,
+    parser: HtmlParser = DEFAULT_PARSER,
+    until: StopAt | None = None,
+    max_bytes: int | None = None,
 ) -> BeautifulSoup:
-    """Get HTML response from URL and parse with BeautifulSoup."""
-    async with _http_get(url, cookies=cookies, headers=headers) as response:
-        text = await response.text(errors="ignore")
-        return BeautifulSoup(text, "html.parser")
+    """
+    Get HTML response from URL and parse with BeautifulSoup.
+
+    With `until` or `max_bytes`, the body is streamed and only the part up
+    to the end of the `until` element, or the byte cap, is read and parsed.
+    """
+    body = await _get_body(
+        url,
+        cookies=cookies,
+        headers=headers,
+        cache=cache,
+        until=until,
+        max_bytes=max_bytes,
+    )
+    return parser.parse(body.text)
 
 
 async def post_json(
@@ -54,6 +121,65 @@ async def post_none(
         return await response.text()
 
 
+async def _get_body(
+    url: str,
+    *,
+    queries: dict[str, str] | None = None,
+    cookies: dict[str, str] | None = None,
+    headers: list[tuple[str, str]] | None = None,
+    cache: bool,
+    until: StopAt | None = None,
+    max_bytes: int | None = None,
+) -> CachedBody:
+    """
+    Read the response body, going through the cache if asked to.
+
+    Concurrent requests for the same key share one in-flight fetch.
+    """
+    streaming = until is not None or max_bytes is not None
+
+    async def fetch(validators: list[tuple[str, str]]) -> CachedBody | None:
+        async with _http_get(
+            url,
+            queries=queries,
+            cookies=cookies,
+            headers=[*(headers or []), *validators],
+        ) as response:
+            if response.status == 304:
+                return None
+            if streaming:
+                encoding = response.charset or "utf-8"
+                reader = EarlyExit(
+                    until=until,
+                    max_bytes=max_bytes or MAX_STREAM_BYTES,
+                    encoding=encoding,
+                )
+                async for chunk in response.content.iter_chunked(_CHUNK_SIZE):
+                    if reader.feed(chunk):
+                        break
+                body = reader.body
+            else:
+                body = await response.read()
+                encoding = response.get_encoding()
+            return CachedBody(
+                body=body,
+                encoding=encoding,
+                etag=response.headers.get("ETag", ""),
+                last_modified=response.headers.get("Last-Modified", ""),
+            )
+
+    # A partial body must not be served to a caller that wants all of it.
+    method = f"GET until {until} within {max_bytes}" if streaming else "GET"
+    key = make_key(method, url, queries=queries, cookies=cookies, headers=headers)
+
+    async def load() -> CachedBody:
+        if not cache:
+            return await fetch_fresh(fetch)
+        return await cached_get(key, fetch)
+
+    return await _inflight.do(key, load)
+
+
 @asynccontextmanager
 async def _http_get(
     url: str,
@@ -64,7 +190,8 @@ async def _http_get(
 ):
     """HTTP GET request with aiohttp."""
     async with (
-        ClientSession() as session,
+        throttle(url),
+        client_session() as session,
         session.get(
             url,
             params=queries,
@@ -85,7 +212,8 @@ async def _http_post(
 ):
     """HTTP POST request with aiohttp."""
     async with (
-        ClientSession() as session,
+        throttle(url),
+        client_session() as session,
         session.post(url, json=data, headers=headers) as response,
     ):
         response.raise_for_status()
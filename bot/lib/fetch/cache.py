@@ -0,0 +1,231 @@
+"""Response cache shared by the fetch implementations."""
+
+import asyncio
+from collections.abc import Awaitable, Callable, Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass
+from logging import getLogger
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from bot.lib.cache import TtlLruCache
+
+from .disk import DiskCache, DiskEntry
+
+
+# Request headers that change the response and so belong in the cache key.
+_VARY_HEADERS = frozenset({"accept", "accept-language", "authorization", "cookie"})
+
+_MAX_BYTES = 32 * 1024 * 1024
+_MAX_DISK_BYTES = 256 * 1024 * 1024
+_DEFAULT_TTL = 10 * 60
+_HOST_TTL: dict[str, float] = {
+    "www.dmm.co.jp": 60 * 60,
+    "book.dmm.co.jp": 60 * 60,
+    "www.dlsite.com": 60 * 60,
+    "nhentai.net": 24 * 60 * 60,
+}
+
+
+_L = getLogger(__name__)
+
+
+type CacheKey = tuple[
+    str,
+    str,
+    tuple[tuple[str, str], ...],
+    tuple[tuple[str, str], ...],
+    tuple[tuple[str, str], ...],
+]
+
+
+@dataclass(frozen=True, kw_only=True)
+class CachedBody:
+    body: bytes
+    encoding: str
+    etag: str = ""
+    last_modified: str = ""
+
+    @property
+    def text(self) -> str:
+        return self.body.decode(self.encoding, errors="ignore")
+
+    @property
+    def validators(self) -> list[tuple[str, str]]:
+        """Conditional request headers to revalidate this body."""
+        headers: list[tuple[str, str]] = []
+        if self.etag:
+            headers.append(("If-None-Match", self.etag))
+        if self.last_modified:
+            headers.append(("If-Modified-Since", self.last_modified))
+        return headers
+
+
+class ResponseCache:
+    """Raw response bodies with a byte budget, LRU eviction and per-host TTL."""
+
+    def __init__(
+        self,
+        *,
+        max_bytes: int,
+        default_ttl: float,
+        host_ttl: Mapping[str, float],
+    ) -> None:
+        self._default_ttl = default_ttl
+        self._host_ttl = dict(host_ttl)
+        self._store = TtlLruCache[CacheKey, CachedBody](
+            max_size=max_bytes, sizeof=lambda _: len(_.body)
+        )
+
+    @property
+    def hits(self) -> int:
+        return self._store.hits
+
+    @property
+    def misses(self) -> int:
+        return self._store.misses
+
+    @property
+    def size(self) -> int:
+        return self._store.size
+
+    def get(self, key: CacheKey) -> CachedBody | None:
+        return self._store.get(key)
+
+    def put(self, key: CacheKey, body: CachedBody) -> None:
+        host = urlsplit(key[1]).hostname or ""
+        ttl = self._host_ttl.get(host, self._default_ttl)
+        self._store.put(key, body, ttl=ttl)
+
+
+_cache: ResponseCache | None = None
+_disk: DiskCache | None = None
+
+
+@contextmanager
+def cache_context(
+    *,
+    max_bytes: int = _MAX_BYTES,
+    default_ttl: float = _DEFAULT_TTL,
+    host_ttl: Mapping[str, float] = _HOST_TTL,
+    disk_path: Path | None = None,
+    max_disk_bytes: int = _MAX_DISK_BYTES,
+):
+    """
+    Enable the response cache for opt-in fetches.
+
+    If `disk_path` is given, bodies that carry validators are also kept
+    on disk and revalidated with conditional requests after a restart.
+    """
+    global _cache, _disk
+
+    cache = ResponseCache(
+        max_bytes=max_bytes, default_ttl=default_ttl, host_ttl=host_ttl
+    )
+    disk = DiskCache(disk_path, max_bytes=max_disk_bytes) if disk_path else None
+    _cache = cache
+    _disk = disk
+    try:
+        yield cache
+    finally:
+        _cache = None
+        _disk = None
+        if disk:
+            disk.close()
+        _L.info(
+            f"response cache: {cache.hits} hits, {cache.misses} misses,"
+            f" {cache.size} bytes"
+        )
+
+
+def make_key(
+    method: str,
+    url: str,
+    *,
+    queries: dict[str, str] | None = None,
+    cookies: dict[str, str] | None = None,
+    headers: list[tuple[str, str]] | None = None,
+) -> CacheKey:
+    return (
+        method.upper(),
+        url,
+        tuple(sorted((queries or {}).items())),
+        tuple(sorted((cookies or {}).items())),
+        tuple(
+            sorted(
+                (name.lower(), value)
+                for name, value in headers or []
+                if name.lower() in _VARY_HEADERS
+            )
+        ),
+    )
+
+
+type ConditionalFetch = Callable[[list[tuple[str, str]]], Awaitable[CachedBody | None]]
+
+
+async def cached_get(key: CacheKey, fetch: ConditionalFetch) -> CachedBody:
+    """
+    Serve from the response cache if enabled, otherwise fetch and store.
+
+    `fetch` receives extra request headers and returns None when the
+    server answers 304 Not Modified.
+    """
+    cache = _cache
+    disk = _disk
+    if not cache:
+        return await fetch_fresh(fetch)
+
+    if body := cache.get(key):
+        return body
+
+    stale = await _load_from_disk(disk, key) if disk else None
+    if not stale:
+        body = await fetch_fresh(fetch)
+    elif revalidated := await fetch(stale.validators):
+        body = revalidated
+    else:
+        _L.debug(f"not modified: {key[1]}")
+        body = stale
+
+    if disk and body is not stale and body.validators:
+        await _save_to_disk(disk, key, body)
+    cache.put(key, body)
+    return body
+
+
+async def fetch_fresh(fetch: ConditionalFetch) -> CachedBody:
+    """Fetch without validators, bypassing the cache."""
+    body = await fetch([])
+    if not body:
+        raise RuntimeError("unexpected 304 response without validators")
+    return body
+
+
+async def _load_from_disk(disk: DiskCache, key: CacheKey) -> CachedBody | None:
+    try:
+        entry = await asyncio.to_thread(disk.get, key)
+    except Exception:
+        _L.exception("failed to read disk cache")
+        return None
+    if not entry:
+        return None
+    return CachedBody(
+        body=entry.body,
+        encoding=entry.encoding,
+        etag=entry.etag,
+        last_modified=entry.last_modified,
+    )
+
+
+async def _save_to_disk(disk: DiskCache, key: CacheKey, body: CachedBody) -> None:
+    entry = DiskEntry(
+        body=body.body,
+        encoding=body.encoding,
+        etag=body.etag,
+        last_modified=body.last_modified,
+    )
+    try:
+        await asyncio.to_thread(disk.put, key, entry)
+    except Exception:
+        _L.exception("failed to write disk cache")
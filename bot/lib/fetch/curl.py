@@ -1,23 +1,116 @@
 """curl_cffi-based fetch implementation."""
 
+import json
 from contextlib import asynccontextmanager
+from dataclasses import dataclass, replace
+from logging import getLogger
 from typing import Any, get_args
+from urllib.parse import urlsplit
 
 from bs4 import BeautifulSoup
 from curl_cffi import AsyncSession, BrowserTypeLiteral, Response
 
+from bot.lib.singleflight import SingleFlight
 from bot.types.json import JsonDict
 
+from .cache import CachedBody, CacheKey, cached_get, fetch_fresh, make_key
+from .limit import throttle
+from .parser import DEFAULT_PARSER, HtmlParser
+from .stream import MAX_STREAM_BYTES, StopAt, trim_body
+
+
+# Recycle a pooled session after this many requests.
+_MAX_SESSION_REQUESTS = 100
+_TIMEOUT = 30
+
+_L = getLogger(__name__)
+_inflight = SingleFlight[CacheKey, CachedBody]()
+
+
+@dataclass(kw_only=True)
+class _PooledSession:
+    session: AsyncSession[Response]
+    fingerprint: BrowserTypeLiteral
+    requests: int = 0
+    active: int = 0
+    retired: bool = False
+
+
+class _SessionPool:
+    """Warm AsyncSession objects, one per host, each pinned to a fingerprint."""
+
+    def __init__(self, *, max_requests: int) -> None:
+        self._max_requests = max_requests
+        self._sessions: dict[str, _PooledSession] = {}
+
+    def acquire(self, host: str) -> _PooledSession:
+        pooled = self._sessions.get(host)
+        if not pooled:
+            fingerprint = _get_random_fingerprint()
+            _L.debug(f"new session for {host} as {fingerprint}")
+            pooled = _PooledSession(
+                # Cookies set by one fetch must not leak into later ones.
+                session=AsyncSession[Response](
+                    impersonate=fingerprint, timeout=_TIMEOUT, discard_cookies=True
+                ),
+                fingerprint=fingerprint,
+            )
+            self._sessions[host] = pooled
+
+        pooled.requests += 1
+        pooled.active += 1
+        if pooled.requests >= self._max_requests:
+            self._retire(host, pooled)
+        return pooled
+
+    async def release(self, pooled: _PooledSession) -> None:
+        pooled.active -= 1
+        if pooled.retired and pooled.active <= 0:
+            await pooled.session.close()
+
+    def discard(self, host: str, pooled: _PooledSession) -> None:
+        """Stop handing out a session, e.g. after a transport error."""
+        self._retire(host, pooled)
+
+    async def close(self) -> None:
+        sessions = list(self._sessions.values())
+        self._sessions.clear()
+        for pooled in sessions:
+            await pooled.session.close()
+
+    def _retire(self, host: str, pooled: _PooledSession) -> None:
+        pooled.retired = True
+        if self._sessions.get(host) is pooled:
+            del self._sessions[host]
+
+
+_pool: _SessionPool | None = None
+
+
+@asynccontextmanager
+async def session_context(*, max_requests: int = _MAX_SESSION_REQUESTS):
+    """Keep a pool of warm curl_cffi sessions alive for all fetch helpers."""
+    global _pool
+
+    pool = _SessionPool(max_requests=max_requests)
+    _pool = pool
+    try:
+        yield pool
+    finally:
+        _pool = None
+        await pool.close()
+
 
 async def get_json(
     url: str,
     *,
     queries: dict[str, str] | None = None,
     headers: list[tuple[str, str]] | None = None,
+    cache: bool = False,
 ) -> Any:
     """Get JSON response from URL using curl_cffi."""
-    async with _http_get(url, queries=queries, headers=headers) as response:
-        return response.json()  # type: ignore
+    body = await _get_body(url, queries=queries, headers=headers, cache=cache)
+    return json.loads(body.text)
 
 
 async def get_html(
@@ -25,11 +118,30 @@ async def get_html(
     *,
     cookies: dict[str, str] | None = None,
     headers: list[tuple[str, str]] | None = None,
+    cache: bool = False,
+    parser: HtmlParser = DEFAULT_PARSER,
+    until: StopAt | None = None,
+    max_bytes: int | None = None,
 ) -> BeautifulSoup:
-    """Get HTML response from URL and parse with BeautifulSoup using curl_cffi."""
-    async with _http_get(url, cookies=cookies, headers=headers) as response:
-        text = response.text
-        return BeautifulSoup(text, "html.parser")
+    """
+    Get HTML response from URL and parse with BeautifulSoup using curl_cffi.
+
+    With `until` or `max_bytes`, only the part up to the end of the `until`
+    element, or the byte cap, is parsed. curl_cffi finishes the transfer
+    before closing a stream, so the whole body is still downloaded.
+    """
+    body = await _get_body(url, cookies=cookies, headers=headers, cache=cache)
+    if until is not None or max_bytes is not None:
+        body = replace(
+            body,
+            body=trim_body(
+                body.body,
+                until=until,
+                max_bytes=max_bytes or MAX_STREAM_BYTES,
+                encoding=body.encoding,
+            ),
+        )
+    return parser.parse(body.text)
 
 
 async def post_json(
@@ -54,6 +166,46 @@ async def post_none(
         return response.text
 
 
+async def _get_body(
+    url: str,
+    *,
+    queries: dict[str, str] | None = None,
+    cookies: dict[str, str] | None = None,
+    headers: list[tuple[str, str]] | None = None,
+    cache: bool,
+) -> CachedBody:
+    """
+    Read the whole response body, going through the cache if asked to.
+
+    Concurrent requests for the same key share one in-flight fetch.
+    """
+
+    async def fetch(validators: list[tuple[str, str]]) -> CachedBody | None:
+        async with _http_get(
+            url,
+            queries=queries,
+            cookies=cookies,
+            headers=[*(headers or []), *validators],
+        ) as response:
+            if response.status_code == 304:
+                return None
+            return CachedBody(
+                body=response.content,
+                encoding=response.encoding or "utf-8",
+                etag=response.headers.get("ETag") or "",
+                last_modified=response.headers.get("Last-Modified") or "",
+            )
+
+    key = make_key("GET", url, queries=queries, cookies=cookies, headers=headers)
+
+    async def load() -> CachedBody:
+        if not cache:
+            return await fetch_fresh(fetch)
+        return await cached_get(key, fetch)
+
+    return await _inflight.do(key, load)
+
+
 @asynccontextmanager
 async def _http_get(
     url: str,
@@ -63,17 +215,15 @@ async def _http_get(
     headers: list[tuple[str, str]] | None = None,
 ):
     """HTTP GET request with curl_cffi AsyncSession."""
-    async with AsyncSession[Response](
-        impersonate=_get_random_fingerprint(), timeout=30
-    ) as session:
+    async with throttle(url), _borrow_session(url) as session:
         response = await session.get(
             url,
             params=queries,
             cookies=cookies,
             headers=headers,
         )
-        response.raise_for_status()
-        yield response
+    response.raise_for_status()
+    yield response
 
 
 @asynccontextmanager
@@ -84,12 +234,33 @@ async def _http_post(
     headers: list[tuple[str, str]] | None = None,
 ):
     """HTTP POST request with curl_cffi AsyncSession."""
-    async with AsyncSession[Response](
-        impersonate=_get_random_fingerprint(), timeout=30
-    ) as session:
+    async with throttle(url), _borrow_session(url) as session:
         response = await session.post(url, json=data, headers=headers)
-        response.raise_for_status()
-        yield response
+    response.raise_for_status()
+    yield response
+
+
+@asynccontextmanager
+async def _borrow_session(url: str):
+    """Borrow the pooled session for the host, or open a one-shot session."""
+    pool = _pool
+    if not pool:
+        async with AsyncSession[Response](
+            impersonate=_get_random_fingerprint(), timeout=_TIMEOUT
+        ) as session:
+            yield session
+        return
+
+    host = urlsplit(url).hostname or ""
+    pooled = pool.acquire(host)
+    try:
+        yield pooled.session
+    except Exception:
+        _L.debug(f"recycle session for {host} as {pooled.fingerprint}")
+        pool.discard(host, pooled)
+        raise
+    finally:
+        await pool.release(pooled)
 
 
 def _get_random_fingerprint() -> BrowserTypeLiteral:
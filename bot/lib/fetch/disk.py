@@ -0,0 +1,113 @@
+"""SQLite-backed response store used to revalidate cached bodies."""
+
+import json
+import sqlite3
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from threading import Lock
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    body BLOB NOT NULL,
+    encoding TEXT NOT NULL,
+    etag TEXT NOT NULL,
+    last_modified TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+)
+"""
+
+
+@dataclass(frozen=True, kw_only=True)
+class DiskEntry:
+    body: bytes
+    encoding: str
+    etag: str
+    last_modified: str
+
+
+class DiskCache:
+    """
+    Response bodies with their validators, evicted by least recent access
+    once the total body size exceeds `max_bytes`.
+
+    All methods block; call them from a worker thread.
+    """
+
+    def __init__(self, path: Path, *, max_bytes: int) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._max_bytes = max_bytes
+        self._lock = Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def get(self, key: object) -> DiskEntry | None:
+        key_text = _to_text(key)
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT body, encoding, etag, last_modified"
+                " FROM responses WHERE key = ?",
+                (key_text,),
+            ).fetchone()
+            if not row:
+                return None
+            self._db.execute(
+                "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                (time.time(), key_text),
+            )
+        body, encoding, etag, last_modified = row
+        return DiskEntry(
+            body=body, encoding=encoding, etag=etag, last_modified=last_modified
+        )
+
+    def put(self, key: object, entry: DiskEntry) -> None:
+        size = len(entry.body)
+        if size > self._max_bytes:
+            return
+
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses"
+                " (key, body, encoding, etag, last_modified, size, accessed_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    _to_text(key),
+                    entry.body,
+                    entry.encoding,
+                    entry.etag,
+                    entry.last_modified,
+                    size,
+                    time.time(),
+                ),
+            )
+            self._evict()
+
+    def _evict(self) -> None:
+        (total,) = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        if total <= self._max_bytes:
+            return
+
+        rows = self._db.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ).fetchall()
+        expired: list[tuple[str]] = []
+        for key_text, size in rows:
+            if total <= self._max_bytes:
+                break
+            expired.append((key_text,))
+            total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", expired)
+
+
+def _to_text(key: object) -> str:
+    return json.dumps(key, ensure_ascii=False, separators=(",", ":"))
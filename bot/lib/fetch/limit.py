@@ -0,0 +1,185 @@
+"""Per-host concurrency and rate limits for upstream requests."""
+
+import time
+from asyncio import Semaphore
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from logging import getLogger
+from urllib.parse import urlsplit
+
+from bot.lib.rate import TokenBucket
+
+
+# Log a request that waited this long (in seconds) for its host's turn.
+_SLOW_WAIT = 1.0
+# Log a host's wait stats each time its request count reaches a multiple of this.
+_REPORT_EVERY = 100
+# The host name that stands for every host without a limit of its own.
+DEFAULT_HOST = "*"
+
+
+@dataclass(frozen=True, kw_only=True)
+class HostLimit:
+    concurrency: int
+    rate: float
+    burst: float
+
+
+_DEFAULT_LIMIT = HostLimit(concurrency=8, rate=10, burst=10)
+_SHORTENER_LIMIT = HostLimit(concurrency=8, rate=10, burst=20)
+_SITE_LIMIT = HostLimit(concurrency=4, rate=4, burst=8)
+_HOST_LIMITS: dict[str, HostLimit] = {
+    # URL resolvers
+    "t.co": _SHORTENER_LIMIT,
+    "x.gd": _SHORTENER_LIMIT,
+    "tinyurl.com": _SHORTENER_LIMIT,
+    "bit.ly": _SHORTENER_LIMIT,
+    "adserver.assistads.net": _SHORTENER_LIMIT,
+    "tr.adplushome.com": _SHORTENER_LIMIT,
+    "ap.octopuspop.com": _SHORTENER_LIMIT,
+    "cloud.xaid.jp": _SHORTENER_LIMIT,
+    "b-short.link": _SITE_LIMIT,
+    "momentary.link": _SITE_LIMIT,
+    "min-link.com": _SITE_LIMIT,
+    "to-link.click": _SITE_LIMIT,
+    "live-dh.cc": _SITE_LIMIT,
+    "ad-dmm.net": _SITE_LIMIT,
+    "ad-dmm.com": _SITE_LIMIT,
+    "dmm-ad.com": _SITE_LIMIT,
+    "live-gx.cc": _SITE_LIMIT,
+    "live-kq.cc": _SITE_LIMIT,
+    "short-net.org": _SITE_LIMIT,
+    # site solvers
+    "www.dmm.co.jp": _SITE_LIMIT,
+    "book.dmm.co.jp": _SITE_LIMIT,
+    "www.dlsite.com": _SITE_LIMIT,
+    "nhentai.net": HostLimit(concurrency=2, rate=2, burst=4),
+}
+
+
+_L = getLogger(__name__)
+
+
+@dataclass(kw_only=True)
+class WaitStats:
+    """How long requests queued for a host before going upstream."""
+
+    requests: int = 0
+    waiting: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+
+class _HostGate:
+    def __init__(self, limit: HostLimit) -> None:
+        self.semaphore = Semaphore(limit.concurrency)
+        self.bucket = TokenBucket(rate=limit.rate, capacity=limit.burst)
+        self.stats = WaitStats()
+
+
+class HostLimiter:
+    """A semaphore and a token bucket per hostname."""
+
+    def __init__(self, *, limits: Mapping[str, HostLimit], default: HostLimit) -> None:
+        self._limits = dict(limits)
+        self._default = default
+        self._gates: dict[str, _HostGate] = {}
+
+    @property
+    def stats(self) -> dict[str, WaitStats]:
+        return {host: gate.stats for host, gate in self._gates.items()}
+
+    @asynccontextmanager
+    async def acquire(self, host: str):
+        gate = self._get_gate(host)
+        stats = gate.stats
+        started = time.monotonic()
+
+        stats.waiting += 1
+        try:
+            await gate.semaphore.acquire()
+            try:
+                await gate.bucket.acquire()
+            except BaseException:
+                gate.semaphore.release()
+                raise
+        finally:
+            stats.waiting -= 1
+
+        waited = time.monotonic() - started
+        stats.requests += 1
+        stats.total_wait += waited
+        stats.max_wait = max(stats.max_wait, waited)
+        if waited >= _SLOW_WAIT:
+            _L.debug(f"waited {waited:.2f}s for {host} ({stats.waiting} still queued)")
+        if stats.requests % _REPORT_EVERY == 0:
+            _log_stats(host, stats)
+
+        try:
+            yield
+        finally:
+            gate.semaphore.release()
+
+    def _get_gate(self, host: str) -> _HostGate:
+        gate = self._gates.get(host)
+        if not gate:
+            gate = _HostGate(self._limits.get(host, self._default))
+            self._gates[host] = gate
+        return gate
+
+
+def _log_stats(host: str, stats: WaitStats) -> None:
+    average = stats.total_wait / stats.requests if stats.requests else 0
+    _L.info(
+        f"{host}: {stats.requests} requests, {stats.waiting} queued,"
+        f" wait avg {average:.3f}s max {stats.max_wait:.3f}s"
+    )
+
+
+_limiter: HostLimiter | None = None
+
+
+def get_wait_stats() -> dict[str, WaitStats]:
+    """Queue-wait stats of every host seen so far, while limits apply."""
+    return _limiter.stats if _limiter else {}
+
+
+@asynccontextmanager
+async def limit_context(
+    *,
+    limits: Mapping[str, HostLimit] = _HOST_LIMITS,
+    default: HostLimit = _DEFAULT_LIMIT,
+    overrides: Mapping[str, HostLimit] | None = None,
+):
+    """
+    Apply per-host limits to every upstream request.
+
+    `overrides` replaces the limits of single hosts, and under
+    `DEFAULT_HOST`, the default.
+    """
+    global _limiter
+
+    overrides = dict(overrides or {})
+    default = overrides.pop(DEFAULT_HOST, default)
+    limiter = HostLimiter(limits={**limits, **overrides}, default=default)
+    _limiter = limiter
+    try:
+        yield limiter
+    finally:
+        _limiter = None
+        for host, stats in limiter.stats.items():
+            _log_stats(host, stats)
+
+
+@asynccontextmanager
+async def throttle(url: str):
+    """Wait for the host's turn before talking to it."""
+    limiter = _limiter
+    if not limiter:
+        yield
+        return
+
+    host = urlsplit(url).hostname or ""
+    async with limiter.acquire(host):
+        yield
@@ -0,0 +1,48 @@
+"""HTML parser strategies for get_html."""
+
+from dataclasses import dataclass
+from functools import cache
+from logging import getLogger
+
+from bs4 import BeautifulSoup, SoupStrainer
+from bs4.builder import builder_registry
+
+
+_L = getLogger(__name__)
+
+
+@dataclass(frozen=True, kw_only=True)
+class HtmlParser:
+    """
+    How get_html builds its tree.
+
+    `features` picks the tree builder; a C-backed one such as lxml is used
+    only if installed, otherwise this falls back to html.parser.
+    `only` restricts the tree to the subtrees under these tag names, so
+    solvers should list every tag their selectors start from.
+    """
+
+    features: str = "html.parser"
+    only: tuple[str, ...] = ()
+
+    def parse(self, text: str) -> BeautifulSoup:
+        parse_only = SoupStrainer(list(self.only)) if self.only else None
+        return BeautifulSoup(
+            text, _get_available_features(self.features), parse_only=parse_only
+        )
+
+
+DEFAULT_PARSER = HtmlParser()
+
+
+def fast_parser(*only: str) -> HtmlParser:
+    """A C-backed parser, optionally restricted to the given tags."""
+    return HtmlParser(features="lxml", only=only)
+
+
+@cache
+def _get_available_features(features: str) -> str:
+    if builder_registry.lookup(features):
+        return features
+    _L.info(f"no tree builder for {features}, using html.parser")
+    return DEFAULT_PARSER.features
@@ -0,0 +1,122 @@
+"""Stop reading HTML once the wanted element has been seen."""
+
+import codecs
+from dataclasses import dataclass
+from html.parser import HTMLParser
+
+
+# Read at most this much of a page when streaming.
+MAX_STREAM_BYTES = 2 * 1024 * 1024
+
+_VOID_TAGS = frozenset(
+    {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta"}
+)
+
+
+@dataclass(frozen=True, kw_only=True)
+class StopAt:
+    """The first element with this tag and attributes ends the read."""
+
+    tag: str
+    attrs: tuple[tuple[str, str], ...] = ()
+
+    def __str__(self) -> str:
+        return self.tag + "".join(f"[{k}={v}]" for k, v in self.attrs)
+
+    def matches(self, tag: str, attrs: list[tuple[str, str | None]]) -> bool:
+        if tag != self.tag:
+            return False
+        found = dict(attrs)
+        for name, value in self.attrs:
+            actual = found.get(name) or ""
+            if name == "class":
+                if value not in actual.split():
+                    return False
+            elif actual.lower() != value.lower():
+                return False
+        return True
+
+
+def stop_at(tag: str, **attrs: str) -> StopAt:
+    """
+    Build a StopAt. Underscores in attribute names become dashes and a
+    trailing underscore is dropped, so `class_` and `http_equiv` work.
+    """
+    return StopAt(
+        tag=tag,
+        attrs=tuple(
+            (name.rstrip("_").replace("_", "-"), value) for name, value in attrs.items()
+        ),
+    )
+
+
+class _Watcher(HTMLParser):
+    def __init__(self, until: StopAt) -> None:
+        super().__init__(convert_charrefs=False)
+        self._until = until
+        self._depth = 0
+        self.done = False
+
+    def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if self.done:
+            return
+        if self._depth:
+            if tag == self._until.tag:
+                self._depth += 1
+            return
+        if not self._until.matches(tag, attrs):
+            return
+        if tag in _VOID_TAGS:
+            self.done = True
+        else:
+            self._depth = 1
+
+    def handle_startendtag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
+        if not self.done and not self._depth and self._until.matches(tag, attrs):
+            self.done = True
+
+    def handle_endtag(self, tag: str) -> None:
+        if self.done or not self._depth or tag != self._until.tag:
+            return
+        self._depth -= 1
+        if not self._depth:
+            self.done = True
+
+
+class EarlyExit:
+    """Collect streamed chunks until `until` has been seen or `max_bytes` read."""
+
+    def __init__(self, *, until: StopAt | None, max_bytes: int, encoding: str) -> None:
+        self._max_bytes = max_bytes
+        self._chunks: list[bytes] = []
+        self._size = 0
+        self._watcher = _Watcher(until) if until else None
+        self._decoder = codecs.getincrementaldecoder(encoding)(errors="ignore")
+
+    @property
+    def body(self) -> bytes:
+        return b"".join(self._chunks)
+
+    def feed(self, chunk: bytes) -> bool:
+        """Keep the chunk and tell whether reading can stop now."""
+        chunk = chunk[: self._max_bytes - self._size]
+        self._chunks.append(chunk)
+        self._size += len(chunk)
+        if self._size >= self._max_bytes:
+            return True
+        if not self._watcher:
+            return False
+        self._watcher.feed(self._decoder.decode(chunk))
+        return self._watcher.done
+
+
+def trim_body(
+    body: bytes, *, until: StopAt | None, max_bytes: int, encoding: str
+) -> bytes:
+    """Cut an already downloaded body the same way a streamed read would."""
+    reader = EarlyExit(until=until, max_bytes=max_bytes, encoding=encoding)
+    step = 8 * 1024
+    for offset in range(0, len(body), step):
+        if reader.feed(body[offset : offset + step]):
+            break
+    return reader.body
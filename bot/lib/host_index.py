@@ -0,0 +1,72 @@
+from collections.abc import Iterable
+from dataclasses import dataclass, field
+
+
+@dataclass(kw_only=True)
+class _Node[V]:
+    children: dict[str, "_Node[V]"] = field(default_factory=dict)
+    exact: V | None = None
+    suffix: V | None = None
+
+
+class HostIndex[V]:
+    """
+    Route host names to values with one walk over a reversed-label trie.
+
+    Rules are written as:
+    - `www.example.com` matches that host only.
+    - `*.example.com` matches any subdomain of example.com, at any depth.
+    - `*` matches every host.
+
+    An exact rule beats a suffix rule, a longer suffix beats a shorter one,
+    and `*` is used only when nothing else matches.
+    """
+
+    def __init__(self, rules: Iterable[tuple[str, V]] = ()) -> None:
+        self._root = _Node[V]()
+        self._wildcard: V | None = None
+        for pattern, value in rules:
+            self.add(pattern, value)
+
+    def add(self, pattern: str, value: V) -> None:
+        pattern = _normalize(pattern)
+        if pattern == "*":
+            self._wildcard = value
+            return
+
+        is_suffix = pattern.startswith("*.")
+        if is_suffix:
+            pattern = pattern[2:]
+        labels = pattern.split(".")
+        if not all(labels) or "*" in labels:
+            raise ValueError(f"invalid host rule: {pattern}")
+
+        node = self._root
+        for label in reversed(labels):
+            node = node.children.setdefault(label, _Node[V]())
+        if is_suffix:
+            node.suffix = value
+        else:
+            node.exact = value
+
+    def get(self, hostname: str | None) -> V | None:
+        if not hostname:
+            return None
+
+        labels = _normalize(hostname).split(".")
+        best = self._wildcard
+        node = self._root
+        for depth, label in enumerate(reversed(labels), start=1):
+            node = node.children.get(label)
+            if not node:
+                break
+            if depth == len(labels):
+                if node.exact is not None:
+                    return node.exact
+            elif node.suffix is not None:
+                best = node.suffix
+        return best
+
+
+def _normalize(hostname: str) -> str:
+    return hostname.lower().rstrip(".")
@@ -0,0 +1,178 @@
+"""Pace and retry outgoing Telegram requests."""
+
+import random
+import time
+from asyncio import sleep
+from collections.abc import Awaitable, Callable
+from contextlib import asynccontextmanager
+from logging import getLogger
+
+from telegram.constants import FloodLimit
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from bot.lib.cache import TtlLruCache
+from bot.lib.rate import TokenBucket
+
+
+# Private chats, and groups (negative chat ids), per Telegram's FAQ.
+_PRIVATE_RATE = float(FloodLimit.MESSAGES_PER_SECOND_PER_CHAT)
+_PRIVATE_BURST = 3
+_GROUP_RATE = FloodLimit.MESSAGES_PER_MINUTE_PER_GROUP / 60
+_GROUP_BURST = float(FloodLimit.MESSAGES_PER_MINUTE_PER_GROUP)
+_GLOBAL_RATE = float(FloodLimit.MESSAGES_PER_SECOND)
+# Idle chats drop their bucket after this long.
+_CHAT_TTL = 60 * 60
+_MAX_CHATS = 10_000
+# Backoff for network errors, in seconds.
+_BACKOFF_BASE = 0.5
+_BACKOFF_MAX = 30
+# RetryAfter is always honored, but only this many times per request.
+_MAX_FLOOD_WAITS = 5
+# Log the queue depth each time it reaches a multiple of this.
+_REPORT_EVERY = 50
+
+
+_L = getLogger(__name__)
+
+
+class OutboundScheduler:
+    """
+    Send requests to Telegram no faster than its flood limits allow.
+
+    Every request waits for a token from its chat's bucket and from the
+    global bucket. A chat told to RetryAfter is paused as a whole, and
+    network errors are retried with jittered exponential backoff.
+    """
+
+    def __init__(self) -> None:
+        self._global = TokenBucket(rate=_GLOBAL_RATE, capacity=_GLOBAL_RATE)
+        self._chats = TtlLruCache[int, TokenBucket](max_size=_MAX_CHATS)
+        self._paused_until: dict[int, float] = {}
+        self._depth = 0
+        self.max_depth = 0
+        self.sent = 0
+        self.flood_waits = 0
+
+    @property
+    def depth(self) -> int:
+        """Requests waiting for their turn."""
+        return self._depth
+
+    async def send[T](
+        self,
+        chat_id: int | None,
+        coro_factory: Callable[[], Awaitable[T]],
+        *,
+        max_retries: int,
+    ) -> T:
+        for attempt in range(max_retries):
+            flood_waits = 0
+            while True:
+                await self._wait_for_turn(chat_id)
+                try:
+                    rv = await coro_factory()
+                except RetryAfter as e:
+                    flood_waits += 1
+                    if flood_waits > _MAX_FLOOD_WAITS:
+                        raise
+                    await self._pause(chat_id, _get_retry_after(e))
+                    continue
+                except BadRequest:
+                    # A subclass of NetworkError, but retrying will not help.
+                    raise
+                except NetworkError:
+                    if attempt >= max_retries - 1:
+                        _L.error(
+                            f"Telegram request failed after {max_retries} attempts"
+                        )
+                        raise
+                    delay = _get_backoff(attempt)
+                    _L.warning(
+                        f"Telegram request failed on attempt"
+                        f" {attempt + 1}/{max_retries}, retrying in {delay:.1f}s"
+                    )
+                    await sleep(delay)
+                    break
+                self.sent += 1
+                return rv
+
+        raise RuntimeError("unreachable code in OutboundScheduler.send")
+
+    async def _wait_for_turn(self, chat_id: int | None) -> None:
+        self._depth += 1
+        self.max_depth = max(self.max_depth, self._depth)
+        if self._depth % _REPORT_EVERY == 0:
+            _L.info(f"outbound queue depth: {self._depth}")
+        try:
+            if chat_id is not None:
+                await self._wait_for_chat(chat_id)
+                await self._get_chat_bucket(chat_id).acquire()
+            await self._global.acquire()
+        finally:
+            self._depth -= 1
+
+    async def _wait_for_chat(self, chat_id: int) -> None:
+        while chat_id in self._paused_until:
+            delay = self._paused_until[chat_id] - time.monotonic()
+            if delay <= 0:
+                del self._paused_until[chat_id]
+                return
+            await sleep(delay)
+
+    async def _pause(self, chat_id: int | None, seconds: float) -> None:
+        """Hold back the chat, or just this request if it has no chat."""
+        self.flood_waits += 1
+        # A little extra, so paused senders do not all wake at once.
+        seconds += random.uniform(0, 1)
+        _L.warning(f"flood control for chat {chat_id}, pausing {seconds:.1f}s")
+        if chat_id is None:
+            await sleep(seconds)
+            return
+        until = time.monotonic() + seconds
+        self._paused_until[chat_id] = max(self._paused_until.get(chat_id, 0), until)
+
+    def _get_chat_bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if not bucket:
+            if chat_id < 0:
+                bucket = TokenBucket(rate=_GROUP_RATE, capacity=_GROUP_BURST)
+            else:
+                bucket = TokenBucket(rate=_PRIVATE_RATE, capacity=_PRIVATE_BURST)
+        self._chats.put(chat_id, bucket, ttl=_CHAT_TTL)
+        return bucket
+
+
+def _get_retry_after(e: RetryAfter) -> float:
+    retry_after = e.retry_after
+    if isinstance(retry_after, (int, float)):
+        return float(retry_after)
+    return retry_after.total_seconds()
+
+
+def _get_backoff(attempt: int) -> float:
+    delay = min(_BACKOFF_BASE * 2**attempt, _BACKOFF_MAX)
+    return delay * random.uniform(0.5, 1.5)
+
+
+_scheduler: OutboundScheduler | None = None
+
+
+def get_outbound_scheduler() -> OutboundScheduler | None:
+    return _scheduler
+
+
+@asynccontextmanager
+async def outbound_context():
+    """Route every Telegram reply through one scheduler."""
+    global _scheduler
+
+    scheduler = OutboundScheduler()
+    _scheduler = scheduler
+    try:
+        yield scheduler
+    finally:
+        _scheduler = None
+        _L.info(
+            f"outbound: {scheduler.sent} sent, {scheduler.flood_waits} flood waits,"
+            f" max queue depth {scheduler.max_depth}"
+        )
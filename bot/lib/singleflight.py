@@ -0,0 +1,54 @@
+from asyncio import Task, create_task, shield
+from collections.abc import Callable, Coroutine, Hashable
+from typing import Any
+
+
+class _Call[V]:
+    def __init__(self, task: Task[V]) -> None:
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight[K: Hashable, V]:
+    """
+    Coalesce concurrent calls with the same key.
+
+    The first caller starts the call; everyone who asks for the same key
+    while it is running awaits that same task and gets its result or
+    exception. Cancelling one caller does not cancel the shared call, but
+    once every caller has gone away it is cancelled too.
+    """
+
+    def __init__(self) -> None:
+        self._calls: dict[K, _Call[V]] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: K, fn: Callable[[], Coroutine[Any, Any, V]]) -> V:
+        call = self._calls.get(key)
+        if not call:
+            call = _Call(create_task(fn()))
+            self._calls[key] = call
+            call.task.add_done_callback(lambda _: self._forget(key, _))
+
+        call.waiters += 1
+        try:
+            return await shield(call.task)
+        finally:
+            call.waiters -= 1
+            if not call.waiters and not call.task.done():
+                # Nobody wants the result any more; free what it holds.
+                self._drop(key, call.task)
+                call.task.cancel()
+
+    def _drop(self, key: K, task: Task[V]) -> None:
+        call = self._calls.get(key)
+        if call and call.task is task:
+            del self._calls[key]
+
+    def _forget(self, key: K, task: Task[V]) -> None:
+        self._drop(key, task)
+        # Mark the exception as retrieved in case every caller went away.
+        if not task.cancelled():
+            task.exception()
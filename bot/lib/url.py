@@ -1,18 +1,54 @@
+import asyncio
 import re
+import time
 from base64 import urlsafe_b64decode
+from collections import Counter
 from collections.abc import Awaitable, Callable, Set
-from functools import partial, wraps
+from functools import partial
 from logging import getLogger
 from pathlib import PurePath
 from typing import NamedTuple
-from urllib.parse import SplitResult, parse_qs, unquote, urlencode, urlsplit, urlunsplit
+from urllib.parse import (
+    SplitResult,
+    parse_qs,
+    unquote,
+    urlencode,
+    urljoin,
+    urlsplit,
+    urlunsplit,
+)
 
 from aiohttp import ClientSession
 
-from bot.lib.fetch.aio import get_html, get_json
+from bot.lib.fetch.aio import client_session, get_html, get_json
+from bot.lib.fetch.limit import throttle
+from bot.lib.fetch.parser import fast_parser
+from bot.lib.fetch.stream import stop_at
+from bot.lib.host_index import HostIndex
+from bot.lib.singleflight import SingleFlight
+from bot.lib.url_cache import ResolutionCache, get_resolution_cache
 
 
 _L = getLogger(__name__)
+_inflight = SingleFlight[str, str]()
+
+# Statuses meaning the server does not take HEAD for this URL.
+_HEAD_REJECTED = frozenset({403, 404, 405, 501})
+# Budget for one maybe_resolve_url call, in seconds and network hops.
+_DEADLINE = 20
+_MAX_HOPS = 8
+
+# How often each budget limit stopped a resolution, by limit name.
+budget_counter = Counter[str]()
+
+
+class _OutOfBudget(Exception):
+    """Resolving gave up early; `url` is the furthest URL reached."""
+
+    def __init__(self, *, url: str, limit: str) -> None:
+        super().__init__(f"{limit}: {url}")
+        self.url = url
+        self.limit = limit
 
 
 class _Pack(NamedTuple):
@@ -20,25 +56,50 @@ class _Pack(NamedTuple):
     parsed: SplitResult
 
 
+type _PureResolver = Callable[[_Pack], _Pack]
 type _UrlResolver = Callable[[_Pack], Awaitable[_Pack]]
 
 
+class _Pure(NamedTuple):
+    """A resolver that only rewrites the URL, without any I/O."""
+
+    resolve: _PureResolver
+
+
+class _Network(NamedTuple):
+    """
+    A resolver that may have to talk to the network.
+
+    `plan`, if given, resolves offline whenever it can and returns None
+    when only `resolve` can tell.
+    """
+
+    resolve: _UrlResolver
+    plan: Callable[[_Pack], _Pack | None] | None = None
+
+
+type _Resolver = _Pure | _Network
+
+
 def fallback(
-    primary: _UrlResolver, secondary: _UrlResolver, *, on: tuple[type[Exception], ...]
-) -> _UrlResolver:
-    async def combined(pack: _Pack) -> _Pack:
+    primary: _PureResolver,
+    secondary: _PureResolver,
+    *,
+    on: tuple[type[Exception], ...],
+) -> _PureResolver:
+    def combined(pack: _Pack) -> _Pack:
         try:
-            return await primary(pack)
+            return primary(pack)
         except on:
-            return await secondary(pack)
+            return secondary(pack)
 
     return combined
 
 
-def pipe(*resolvers: _UrlResolver) -> _UrlResolver:
-    async def combined(pack: _Pack) -> _Pack:
+def pipe(*resolvers: _PureResolver) -> _PureResolver:
+    def combined(pack: _Pack) -> _Pack:
         for resolver in resolvers:
-            pack = await resolver(pack)
+            pack = resolver(pack)
         return pack
 
     return combined
@@ -55,50 +116,78 @@ def _from_parsed(parsed: SplitResult) -> _Pack:
 
 
 async def _fetch_3xx(pack: _Pack) -> _Pack:
-    async with ClientSession() as session, session.head(pack.url) as response:
+    """
+    Follow one redirect.
+
+    Every hop is a step of its own in _walk, so each one counts against the
+    hop budget, is checked for cycles and is remembered in the resolution
+    cache. Hops reuse connections through the pooled session.
+    """
+    async with client_session() as session:
+        started = time.monotonic()
+        status, location = await _head_or_get(session, pack.url)
+    elapsed = time.monotonic() - started
+    _L.debug(f"(hop) {status} {elapsed * 1000:.0f}ms {pack.url}")
+
+    if not location:
+        raise ValueError(f"no redirect from {pack.url}")
+    return _from_url(urljoin(pack.url, location))
+
+
+async def _head_or_get(session: ClientSession, url: str) -> tuple[int, str]:
+    """One redirect hop. Falls back to GET for servers that reject HEAD."""
+    async with throttle(url), session.head(url, allow_redirects=False) as response:
+        if response.status not in _HEAD_REJECTED:
+            response.raise_for_status()
+            return response.status, response.headers.get("Location", "")
+
+    async with throttle(url), session.get(url, allow_redirects=False) as response:
         response.raise_for_status()
-        location = response.headers["Location"]
-    return _from_url(location)
+        return response.status, response.headers.get("Location", "")
 
 
-async def _get_url_from_query(pack: _Pack, *, key: str) -> _Pack:
+def _get_url_from_query(pack: _Pack, *, key: str) -> _Pack:
     queries = parse_qs(pack.parsed.query)
     value = queries[key]
     last = value[-1]
     return _from_url(last)
 
 
-async def _get_raw_from_query(pack: _Pack, *, key: str) -> _Pack:
+def _get_raw_from_query(pack: _Pack, *, key: str) -> _Pack:
     queries = parse_qs(pack.parsed.query)
     value = queries[key]
     last = value[-1]
     return _Pack(last, urlsplit(last))
 
 
-async def _strip_url_quotes(pack: _Pack) -> _Pack:
+def _strip_url_quotes(pack: _Pack) -> _Pack:
     url = pack.url
     if url.startswith("'") and url.endswith("'"):
         url = url[1:-1]
     return _Pack(url, urlsplit(url))
 
 
-async def _decode_base64_url(pack: _Pack) -> _Pack:
+def _decode_base64_url(pack: _Pack) -> _Pack:
     url = urlsafe_b64decode(pack.url).decode("utf-8")
     return _from_url(url)
 
 
-async def _replace_host(pack: _Pack, *, host: str) -> _Pack:
+def _replace_host(pack: _Pack, *, host: str) -> _Pack:
     parsed = pack.parsed._replace(netloc=host)
     return _from_parsed(parsed)
 
 
-async def _replace_path(pack: _Pack, *, path: str) -> _Pack:
+def _replace_path(pack: _Pack, *, path: str) -> _Pack:
     parsed = pack.parsed._replace(path=path)
     return _from_parsed(parsed)
 
 
 async def _parse_refresh(pack: _Pack) -> _Pack:
-    html = await get_html(pack.url)
+    html = await get_html(
+        pack.url,
+        parser=fast_parser("meta"),
+        until=stop_at("meta", http_equiv="refresh"),
+    )
     meta = html.select_one("meta[http-equiv='refresh']")
     if not meta:
         raise ValueError("no meta tag")
@@ -115,7 +204,7 @@ async def _parse_refresh(pack: _Pack) -> _Pack:
     return _from_url(url)
 
 
-async def _strip_query(pack: _Pack, *, allowed_keys: Set[str]) -> _Pack:
+def _strip_query(pack: _Pack, *, allowed_keys: Set[str]) -> _Pack:
     queries = parse_qs(pack.parsed.query)
     queries = {key: value for key, value in queries.items() if key in allowed_keys}
     query = urlencode(queries, doseq=True)
@@ -135,29 +224,52 @@ async def _handle_addmm(pack: _Pack) -> _Pack:
     return _from_url(url)
 
 
+def _dmm(*, allowed_keys: Set[str]) -> _Network:
+    return _Network(
+        partial(_handle_dmm, allowed_keys=allowed_keys),
+        partial(_plan_dmm, allowed_keys=allowed_keys),
+    )
+
+
 async def _handle_dmm(pack: _Pack, *, allowed_keys: Set[str]) -> _Pack:
-    if pack.parsed.hostname == "dmm.co.jp":
-        new_parsed = pack.parsed._replace(netloc="www.dmm.co.jp")
-        pack = _from_parsed(new_parsed)
+    if planned := _plan_dmm(pack, allowed_keys=allowed_keys):
+        return planned
+    return await _handle_dmm_age_check(_to_www_dmm(pack))
 
+
+def _plan_dmm(pack: _Pack, *, allowed_keys: Set[str]) -> _Pack | None:
+    pack = _to_www_dmm(pack)
     path = PurePath(pack.parsed.path)
 
     if path.parts[0:3] == ("/", "age_check", "="):
-        return await _handle_dmm_age_check(pack)
+        return _plan_dmm_age_check(pack)
 
     if path.parts[0:4] == ("/", "en", "age_check", "="):
-        return await _handle_dmm_age_check(pack)
+        return _plan_dmm_age_check(pack)
+
+    return _strip_query(pack, allowed_keys=allowed_keys)
 
-    return await _strip_query(pack, allowed_keys=allowed_keys)
+
+def _plan_dmm_age_check(pack: _Pack) -> _Pack | None:
+    next_pack = _get_url_from_query(pack, key="rurl")
+    # rurl may be a hash, which needs the age check page.
+    return next_pack if next_pack.parsed.scheme else None
+
+
+def _to_www_dmm(pack: _Pack) -> _Pack:
+    if pack.parsed.hostname != "dmm.co.jp":
+        return pack
+    new_parsed = pack.parsed._replace(netloc="www.dmm.co.jp")
+    return _from_parsed(new_parsed)
 
 
 async def _handle_dmm_age_check(pack: _Pack) -> _Pack:
-    next_pack = await _get_url_from_query(pack, key="rurl")
+    next_pack = _get_url_from_query(pack, key="rurl")
     if next_pack.parsed.scheme:
         return next_pack
 
     # rurl is a hash
-    html = await get_html(pack.url)
+    html = await get_html(pack.url, parser=fast_parser())
     anchor = html.select_one("div.turtle-component > a")
     if not anchor:
         raise ValueError("no anchor tag found")
@@ -167,7 +279,7 @@ async def _handle_dmm_age_check(pack: _Pack) -> _Pack:
     return _from_url(href)
 
 
-async def _handle_dmm_login(pack: _Pack) -> _Pack:
+def _handle_dmm_login(pack: _Pack) -> _Pack:
     path = PurePath(pack.parsed.path)
 
     if path.parts[0:5] != ("/", "service", "login", "password", "="):
@@ -190,7 +302,7 @@ async def _handle_dmm_login(pack: _Pack) -> _Pack:
     return _from_url(f"https://www.dmm.co.jp/age_check/=/?rurl={maybe_url}")
 
 
-async def _extract_dlsite_url_path(pack: _Pack) -> _Pack:
+def _extract_dlsite_url_path(pack: _Pack) -> _Pack:
     path = PurePath(pack.parsed.path)
     # May raise ValueError for invalid url.
     url_index = path.parts.index("url")
@@ -207,39 +319,37 @@ _handle_dlsharing = fallback(
 )
 
 
-def _dlsite_no_touch(fn: _UrlResolver) -> _UrlResolver:
-    @wraps(fn)
-    async def wrapped(pack: _Pack) -> _Pack:
-        new_pack = await fn(pack)
-        path = PurePath(new_pack.parsed.path)
-        if not path.parts[1].endswith("-touch"):
-            return new_pack
+def _dlsite_no_touch(pack: _Pack) -> _Pack:
+    path = PurePath(pack.parsed.path)
+    if not path.parts[1].endswith("-touch"):
+        return pack
 
-        parts_list = list(path.parts)
-        parts_list[1] = parts_list[1][:-6]
-        path = PurePath(*parts_list)
-        return await _replace_path(new_pack, path=str(path))
+    parts_list = list(path.parts)
+    parts_list[1] = parts_list[1][:-6]
+    path = PurePath(*parts_list)
+    return _replace_path(pack, path=str(path))
 
-    return wrapped
 
+async def _handle_dlsite(pack: _Pack) -> _Pack:
+    if planned := _plan_dlsite(pack):
+        return planned
+    return _dlsite_no_touch(await _parse_refresh(pack))
 
-async def _handle_dlsite_inner(pack: _Pack) -> _Pack:
-    # maybe dlaf
-    path = PurePath(pack.parsed.path)
-    if "dlaf" in path.parts:
-        return await _parse_refresh(pack)
-    return await _strip_query(pack, allowed_keys=set())
 
-
-_handle_dlsite = _dlsite_no_touch(
-    fallback(
-        _extract_dlsite_url_path, _handle_dlsite_inner, on=(ValueError, IndexError)
-    )
-)
+def _plan_dlsite(pack: _Pack) -> _Pack | None:
+    try:
+        new_pack = _extract_dlsite_url_path(pack)
+    except (ValueError, IndexError):
+        # maybe dlaf, which needs the refresh page.
+        path = PurePath(pack.parsed.path)
+        if "dlaf" in path.parts:
+            return None
+        new_pack = _strip_query(pack, allowed_keys=set())
+    return _dlsite_no_touch(new_pack)
 
 
 async def _parse_script_1(pack: _Pack) -> _Pack:
-    html = await get_html(pack.url)
+    html = await get_html(pack.url, parser=fast_parser("script"))
     scripts = html.find_all("script")
     if not scripts:
         raise ValueError("no script")
@@ -253,47 +363,64 @@ async def _parse_script_1(pack: _Pack) -> _Pack:
     return _from_url(url)
 
 
-_HOST_TO_URL_RESOLVER: dict[str, _UrlResolver] = {
-    "t.co": _fetch_3xx,
-    "x.gd": _fetch_3xx,
-    "tinyurl.com": _fetch_3xx,
-    "bit.ly": _fetch_3xx,
-    "dlsharing.com": _handle_dlsharing,
-    "dlaf.jp": partial(_replace_host, host="www.dlsite.com"),
-    "adserver.assistads.net": _fetch_3xx,
-    "tr.adplushome.com": _fetch_3xx,
-    "ap.octopuspop.com": _fetch_3xx,
-    "cloud.xaid.jp": _fetch_3xx,
-    "al.fanza.co.jp": partial(_get_url_from_query, key="lurl"),
-    "al.dmm.co.jp": partial(_get_url_from_query, key="lurl"),
-    "al.mm.co.jp": partial(_get_url_from_query, key="lurl"),
-    "al.dmm.com": partial(_get_url_from_query, key="lurl"),
-    "rcv.idx.dmm.com": partial(_get_url_from_query, key="lurl"),
-    "rcv.ixd.dmm.com": partial(_get_url_from_query, key="lurl"),
-    "rcv.ixd.dmm.co.jp": partial(_get_url_from_query, key="lurl"),
-    "lp.ixd.dmm.com": partial(_get_url_from_query, key="lpurl"),
-    "ip.affiliate.dmm.com": pipe(
-        partial(_get_raw_from_query, key="lurl"), _strip_url_quotes, _decode_base64_url
+def _handle_dmm_affiliate(pack: _Pack) -> _Pack:
+    queries = parse_qs(pack.parsed.query)
+    for key in ("lurl", "lpurl"):
+        if value := queries.get(key):
+            return _from_url(value[-1])
+    return pack
+
+
+_URL_RESOLVER_RULES: dict[str, _Resolver] = {
+    "t.co": _Network(_fetch_3xx),
+    "x.gd": _Network(_fetch_3xx),
+    "tinyurl.com": _Network(_fetch_3xx),
+    "bit.ly": _Network(_fetch_3xx),
+    "dlsharing.com": _Pure(_handle_dlsharing),
+    "dlaf.jp": _Pure(partial(_replace_host, host="www.dlsite.com")),
+    "adserver.assistads.net": _Network(_fetch_3xx),
+    "tr.adplushome.com": _Network(_fetch_3xx),
+    "ap.octopuspop.com": _Network(_fetch_3xx),
+    "cloud.xaid.jp": _Network(_fetch_3xx),
+    "al.fanza.co.jp": _Pure(partial(_get_url_from_query, key="lurl")),
+    "al.dmm.co.jp": _Pure(partial(_get_url_from_query, key="lurl")),
+    "al.mm.co.jp": _Pure(partial(_get_url_from_query, key="lurl")),
+    "al.dmm.com": _Pure(partial(_get_url_from_query, key="lurl")),
+    "rcv.idx.dmm.com": _Pure(partial(_get_url_from_query, key="lurl")),
+    "rcv.ixd.dmm.com": _Pure(partial(_get_url_from_query, key="lurl")),
+    "rcv.ixd.dmm.co.jp": _Pure(partial(_get_url_from_query, key="lurl")),
+    "lp.ixd.dmm.com": _Pure(partial(_get_url_from_query, key="lpurl")),
+    "ip.affiliate.dmm.com": _Pure(
+        pipe(
+            partial(_get_raw_from_query, key="lurl"),
+            _strip_url_quotes,
+            _decode_base64_url,
+        )
     ),
-    "numa2.com": pipe(partial(_get_raw_from_query, key="u"), _decode_base64_url),
-    "b-short.link": _parse_refresh,
-    "momentary.link": _parse_refresh,
-    "min-link.com": _parse_refresh,
-    "to-link.click": _parse_refresh,
-    "live-dh.cc": _parse_script_1,
-    "ad-dmm.net": _handle_addmm,
-    "ad-dmm.com": _handle_addmm,
-    "dmm-ad.com": _handle_addmm,
-    "live-gx.cc": _handle_addmm,
-    "live-kq.cc": _handle_addmm,
-    "short-net.org": _handle_addmm,
-    "dmm.co.jp": partial(_handle_dmm, allowed_keys=set()),
-    "www.dmm.co.jp": partial(_handle_dmm, allowed_keys=set()),
-    "book.dmm.co.jp": partial(_handle_dmm, allowed_keys=set()),
-    "video.dmm.co.jp": partial(_handle_dmm, allowed_keys={"id"}),
-    "accounts.dmm.co.jp": _handle_dmm_login,
-    "www.dlsite.com": _handle_dlsite,
+    "numa2.com": _Pure(pipe(partial(_get_raw_from_query, key="u"), _decode_base64_url)),
+    "b-short.link": _Network(_parse_refresh),
+    "momentary.link": _Network(_parse_refresh),
+    "min-link.com": _Network(_parse_refresh),
+    "to-link.click": _Network(_parse_refresh),
+    "live-dh.cc": _Network(_parse_script_1),
+    "ad-dmm.net": _Network(_handle_addmm),
+    "ad-dmm.com": _Network(_handle_addmm),
+    "dmm-ad.com": _Network(_handle_addmm),
+    "live-gx.cc": _Network(_handle_addmm),
+    "live-kq.cc": _Network(_handle_addmm),
+    "short-net.org": _Network(_handle_addmm),
+    "dmm.co.jp": _dmm(allowed_keys=set()),
+    "www.dmm.co.jp": _dmm(allowed_keys=set()),
+    "book.dmm.co.jp": _dmm(allowed_keys=set()),
+    "video.dmm.co.jp": _dmm(allowed_keys={"id"}),
+    "accounts.dmm.co.jp": _Pure(_handle_dmm_login),
+    "www.dlsite.com": _Network(_handle_dlsite, _plan_dlsite),
+    # Affiliate subdomains come and go; catch the ones not listed above.
+    "*.dmm.com": _Pure(_handle_dmm_affiliate),
+    "*.dmm.co.jp": _Pure(_handle_dmm_affiliate),
+    "*.fanza.co.jp": _Pure(_handle_dmm_affiliate),
 }
+_HOST_TO_URL_RESOLVER = HostIndex(_URL_RESOLVER_RULES.items())
 
 
 async def maybe_resolve_url(url: str) -> str:
@@ -303,27 +430,92 @@ async def maybe_resolve_url(url: str) -> str:
     2. If a handler exists for the hostname, call it and get the result URL.
     3. If the result URL's hostname is _TERMINAL_HOSTS, return it.
     4. Otherwise, repeat from step 2 with the new URL.
+
+    Each call has a deadline and a hop budget, and stops on redirect
+    cycles. Running out returns the furthest URL reached instead of failing.
+
+    Resolved chains are remembered hop by hop, so any URL seen along a chain
+    resolves straight to the final URL next time.
+    Rewrites that need no I/O are done right here, without a task; only a
+    URL left for the network goes through single-flight, so concurrent
+    calls for the same URL share one resolution.
     """
-    _L.debug(f"(resolving) {url}")
     try:
         pack = _from_url(url)
     except ValueError:
         _L.debug(f"not a url")
         return url
 
+    try:
+        pack, resolve = _plan_offline(pack)
+    except _OutOfBudget as e:
+        return _give_up(e)
+    if not resolve:
+        return pack.url
+
+    return await _inflight.do(pack.url, partial(_resolve_url, pack))
+
+
+async def _resolve_url(pack: _Pack) -> str:
+    _L.debug(f"(resolving) {pack.url}")
+    cache = get_resolution_cache()
+    # URLs that went through a resolver, in order.
+    chain: list[str] = []
+    try:
+        final_url = await _walk(pack, chain=chain, cache=cache)
+    except _OutOfBudget as e:
+        # A partial chain is not worth remembering either way.
+        return _give_up(e)
+    except Exception:
+        if cache and chain:
+            cache.remember_failure(chain)
+        raise
+
+    if cache and chain:
+        cache.remember([*chain, final_url])
+    return final_url
+
+
+def _give_up(e: _OutOfBudget) -> str:
+    budget_counter[e.limit] += 1
+    _L.warning(
+        f"{e.limit} budget ran out ({budget_counter[e.limit]} so far),"
+        f" stopped at {e.url}"
+    )
+    return e.url
+
+
+async def _walk(pack: _Pack, *, chain: list[str], cache: ResolutionCache | None) -> str:
+    deadline = asyncio.get_running_loop().time() + _DEADLINE
+    visited: set[str] = set()
     while True:
-        hostname = pack.parsed.hostname
-        if not hostname:
-            _L.debug(f"not a url")
+        pack, resolve = _plan_offline(pack)
+        if not resolve:
+            _L.debug(f"(resolved) {pack.url}")
             return pack.url
 
+        if cache:
+            if cached_url := cache.get(pack.url):
+                _L.debug(f"(cached) {cached_url}")
+                return cached_url
+            if cache.has_failed(pack.url):
+                raise ValueError(f"resolving failed recently: {pack.url}")
+
+        if pack.url in visited:
+            raise _OutOfBudget(url=pack.url, limit="cycle")
+        if len(chain) >= _MAX_HOPS:
+            raise _OutOfBudget(url=pack.url, limit="hops")
+        visited.add(pack.url)
+        chain.append(pack.url)
+
+        timeout = asyncio.timeout_at(deadline)
         try:
-            resolver = _HOST_TO_URL_RESOLVER[hostname]
-        except KeyError:
-            _L.debug(f"no resolver for {hostname}")
-            return pack.url
-
-        next_pack = await resolver(pack)
+            async with timeout:
+                next_pack = await resolve(pack)
+        except TimeoutError:
+            if not timeout.expired():
+                raise
+            raise _OutOfBudget(url=pack.url, limit="deadline") from None
 
         # If the URL did not change, stop to avoid infinite loop.
         if next_pack.url == pack.url:
@@ -333,3 +525,40 @@ async def maybe_resolve_url(url: str) -> str:
         # Continue resolving with the new URL parts.
         pack = next_pack
         _L.debug(f"(resolving) {pack.url}")
+
+
+def _plan_offline(pack: _Pack) -> tuple[_Pack, _UrlResolver | None]:
+    """
+    Apply every rewrite that needs no I/O, synchronously.
+    Returns the rewritten URL and the network resolver to run next, if any.
+    """
+    rewritten: set[str] = set()
+    while True:
+        hostname = pack.parsed.hostname
+        if not hostname:
+            _L.debug(f"not a url")
+            return pack, None
+
+        match _HOST_TO_URL_RESOLVER.get(hostname):
+            case None:
+                _L.debug(f"no resolver for {hostname}")
+                return pack, None
+            case _Pure(resolve):
+                next_pack = resolve(pack)
+            case _Network(resolve, None):
+                return pack, resolve
+            case _Network(resolve, plan):
+                maybe_pack = plan(pack)
+                if not maybe_pack:
+                    return pack, resolve
+                next_pack = maybe_pack
+
+        # If the URL did not change, there is nothing left to rewrite.
+        if next_pack.url == pack.url:
+            return pack, None
+        if next_pack.url in rewritten:
+            raise _OutOfBudget(url=pack.url, limit="cycle")
+        rewritten.add(pack.url)
+
+        pack = next_pack
+        _L.debug(f"(rewritten) {pack.url}")
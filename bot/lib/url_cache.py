@@ -0,0 +1,118 @@
+import json
+import time
+from collections.abc import Sequence
+from contextlib import asynccontextmanager
+from logging import getLogger
+from pathlib import Path
+
+from bot.lib.cache import TtlLruCache
+
+
+_MAX_ENTRIES = 10_000
+_TTL = 7 * 24 * 60 * 60
+_NEGATIVE_TTL = 10 * 60
+
+
+_L = getLogger(__name__)
+
+
+class ResolutionCache:
+    """
+    Remember where URLs resolve to.
+
+    Every hop of a resolved chain points straight at the final URL, and
+    URLs whose resolution failed are remembered for a shorter while.
+    Expiry uses wall time so entries can be saved and loaded again.
+    """
+
+    def __init__(self, *, max_entries: int, ttl: float, negative_ttl: float) -> None:
+        self._ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._resolved = TtlLruCache[str, str](max_size=max_entries, clock=time.time)
+        self._failed = TtlLruCache[str, bool](max_size=max_entries, clock=time.time)
+
+    @property
+    def hits(self) -> int:
+        return self._resolved.hits
+
+    @property
+    def misses(self) -> int:
+        return self._resolved.misses
+
+    def get(self, url: str) -> str | None:
+        return self._resolved.get(url)
+
+    def has_failed(self, url: str) -> bool:
+        return bool(self._failed.get(url))
+
+    def remember(self, chain: Sequence[str]) -> None:
+        """Point every URL in the chain at its last URL."""
+        final = chain[-1]
+        for url in chain:
+            self._resolved.put(url, final, ttl=self._ttl)
+            self._failed.pop(url)
+
+    def remember_failure(self, chain: Sequence[str]) -> None:
+        for url in chain:
+            self._failed.put(url, True, ttl=self._negative_ttl)
+
+    def load(self, path: Path) -> None:
+        try:
+            with path.open("r", encoding="utf-8") as fin:
+                rows: list[list[object]] = json.load(fin)
+        except FileNotFoundError:
+            return
+        except Exception:
+            _L.exception(f"failed to load {path}")
+            return
+
+        now = time.time()
+        for url, final, expires_at in rows:
+            if not isinstance(url, str) or not isinstance(final, str):
+                continue
+            if not isinstance(expires_at, (int, float)):
+                continue
+            self._resolved.put(url, final, ttl=expires_at - now)
+
+    def save(self, path: Path) -> None:
+        rows = [list(_) for _ in self._resolved.items()]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(".tmp")
+        with tmp_path.open("w", encoding="utf-8") as fout:
+            json.dump(rows, fout, ensure_ascii=False)
+        tmp_path.replace(path)
+
+
+_cache: ResolutionCache | None = None
+
+
+def get_resolution_cache() -> ResolutionCache | None:
+    return _cache
+
+
+@asynccontextmanager
+async def resolution_cache_context(
+    *,
+    cache_dir: str = "",
+    max_entries: int = _MAX_ENTRIES,
+    ttl: float = _TTL,
+    negative_ttl: float = _NEGATIVE_TTL,
+):
+    """Enable the URL resolution cache, persisted under `cache_dir` if given."""
+    global _cache
+
+    path = Path(cache_dir) / "urls.json" if cache_dir else None
+    cache = ResolutionCache(max_entries=max_entries, ttl=ttl, negative_ttl=negative_ttl)
+    if path:
+        cache.load(path)
+    _cache = cache
+    try:
+        yield cache
+    finally:
+        _cache = None
+        _L.info(f"resolution cache: {cache.hits} hits, {cache.misses} misses")
+        if path:
+            try:
+                cache.save(path)
+            except Exception:
+                _L.exception(f"failed to save {path}")
@@ -9,6 +9,10 @@ from .context import get_context
 from .daemon.api import api_daemon
 from .daemon.bot import bot_daemon
 from .handlers.lib import generate_answers
+from .lib.answer_cache import answer_cache_context
+from .lib.fetch import fetch_context
+from .lib.outbound import outbound_context
+from .lib.url_cache import resolution_cache_context
 from .processors.pipeline import create_multiple_solver, create_single_solver
 
 
@@ -22,6 +26,10 @@ async def _main_daemon() -> int:
     lock = _setup_signals()
 
     async with (
+        fetch_context(cache_dir=context.cache_dir, host_limits=context.host_limits),
+        resolution_cache_context(cache_dir=context.cache_dir),
+        answer_cache_context(),
+        outbound_context(),
         bot_daemon(context) as (webhook, enqueue),
         api_daemon(context, webhook=webhook, enqueue=enqueue),
     ):
@@ -42,13 +50,22 @@ async def _main_pipeline(unknown_text: str) -> int:
         multiple_solve = create_multiple_solver(context)
 
         # Collect all answers
-        answers = [
-            answer
-            async for answer in generate_answers(
-                unknown_text, single_solve=single_solve, multiple_solve=multiple_solve
-            )
-            if answer
-        ]
+        async with (
+            fetch_context(cache_dir=context.cache_dir, host_limits=context.host_limits),
+            resolution_cache_context(cache_dir=context.cache_dir),
+            answer_cache_context(),
+        ):
+            answers = [
+                answer
+                async for answer in generate_answers(
+                    unknown_text,
+                    single_solve=single_solve,
+                    multiple_solve=multiple_solve,
+                    max_workers=context.max_line_workers,
+                    ordered=context.ordered_answers,
+                )
+                if answer
+            ]
 
         # Convert to JSON and print
         result = [answer.to_dict() for answer in answers]
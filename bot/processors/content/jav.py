@@ -6,12 +6,23 @@ from wcpan.jav.types import Product
 
 from bot.context import Context
 from bot.lib.keyboard import make_av_keyboard, make_link_preview
+from bot.processors.dispatch import DispatchTable, InputKind
 from bot.types.answer import Answer, Solver
 
 
 _L = getLogger(__name__)
 
 
+def register(table: DispatchTable, context: Context) -> None:
+    table.add(
+        "jav",
+        create_solver(context),
+        InputKind.URL,
+        InputKind.NUMERIC_ID,
+        InputKind.TEXT,
+    )
+
+
 def create_solver(context: Context) -> Solver:
     return partial(_solve, dvd_origin=context.dvd_origin)
 
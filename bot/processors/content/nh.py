@@ -4,13 +4,20 @@ from logging import getLogger
 
 from bot.context import Context
 from bot.lib.fetch.curl import get_html
+from bot.lib.fetch.parser import fast_parser
+from bot.lib.fetch.stream import stop_at
 from bot.lib.keyboard import make_book_keyboard, make_link_preview
+from bot.processors.dispatch import DispatchTable, InputKind
 from bot.types.answer import Answer, Solver
 
 
 _L = getLogger(__name__)
 
 
+def register(table: DispatchTable, context: Context) -> None:
+    table.add("nh", create_solver(context), InputKind.NUMERIC_ID)
+
+
 def create_solver(context: Context) -> Solver:
     return partial(_solve, dvd_origin=context.dvd_origin)
 
@@ -36,7 +43,12 @@ async def _solve(unknown_text: str, /, *, dvd_origin: str) -> Answer | None:
 
 async def _fetch_author(url: str, /) -> str:
     try:
-        html = await get_html(url)
+        html = await get_html(
+            url,
+            cache=True,
+            parser=fast_parser("h2"),
+            until=stop_at("h2", class_="title"),
+        )
     except Exception:
         _L.exception("failed to fetch nhentai url=%s", url)
         return ""
@@ -1,10 +1,13 @@
 from collections.abc import Sequence
 from functools import partial
 from logging import getLogger
+from types import ModuleType
 from typing import Protocol
 from urllib.parse import SplitResult, urlsplit
 
 from bot.context import Context
+from bot.lib.host_index import HostIndex
+from bot.processors.dispatch import DispatchTable, InputKind
 from bot.processors.pipeline import first_not_none
 from bot.types.answer import Answer, Solver
 
@@ -16,21 +19,31 @@ class _SubParser(Protocol):
 _L = getLogger(__name__)
 
 
+def register(table: DispatchTable, context: Context) -> None:
+    for site in _get_site_list():
+        table.add_hosts(site.HOSTS)
+    table.add("sites", create_solver(context), InputKind.SITE_URL)
+
+
 def create_solver(context: Context) -> Solver:
-    from .dlsite import solve as dlsite
-    from .dmm import solve as dmm
-    from .mgstage import solve as mgstage
-    from .nh import solve as nh
-    from .nyaa import solve as nyaa
+    # Sites sharing a host rule are tried in site list order.
+    rules: dict[str, list[_SubParser]] = {}
+    for site in _get_site_list():
+        parser = partial(site.solve, context=context)
+        for host in site.HOSTS:
+            rules.setdefault(host, []).append(parser)
+
+    return partial(_solve, index=HostIndex(rules.items()))
 
-    site_list = [dmm, mgstage, dlsite, nyaa, nh]
-    parser_list = [partial(_, context=context) for _ in site_list]
 
-    return partial(_solve, parser_list=parser_list)
+def _get_site_list() -> list[ModuleType]:
+    from . import dlsite, dmm, mgstage, nh, nyaa
+
+    return [dmm, mgstage, dlsite, nyaa, nh]
 
 
 async def _solve(
-    unknown_text: str, /, *, parser_list: Sequence[_SubParser]
+    unknown_text: str, /, *, index: HostIndex[Sequence[_SubParser]]
 ) -> Answer | None:
     try:
         parsed_url = urlsplit(unknown_text)
@@ -38,7 +51,11 @@ async def _solve(
         _L.debug(f"not a url: {e}")
         return None
 
+    parser_list = index.get(parsed_url.hostname)
+    if not parser_list:
+        return None
+
     callback_list = (
         partial(_, url=unknown_text, parsed_url=parsed_url) for _ in parser_list
     )
-    return await first_not_none(callback_list)
+    return await first_not_none(callback_list, race=True)
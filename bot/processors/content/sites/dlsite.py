@@ -6,13 +6,21 @@ from bs4 import BeautifulSoup
 
 from bot.context import Context
 from bot.lib.fetch.aio import get_html
+from bot.lib.fetch.parser import fast_parser
+from bot.lib.fetch.stream import StopAt, stop_at
 from bot.lib.keyboard import make_book_keyboard, make_link_preview
 from bot.types.answer import Answer
 
 
 type _Parser = Callable[[BeautifulSoup], str]
+type _Target = tuple[_Parser, StopAt]
 
 
+HOSTS: set[str] = {
+    "www.dlsite.com",
+}
+# Both page layouts only need the maker span and the outline tables.
+_PARSER = fast_parser("span", "table")
 _BOOK_CATEGORIES: set[tuple[str, str]] = {
     ("books", "work"),
 }
@@ -38,30 +46,28 @@ async def solve(
 
 
 async def _find_author(*, url: str, parsed_url: SplitResult) -> str:
-    if parsed_url.hostname != "www.dlsite.com":
-        return ""
-
-    parse = _dispatch_parser(parsed_url)
-    if not parse:
+    target = _dispatch_parser(parsed_url)
+    if not target:
         return ""
+    parse, until = target
 
     try:
-        html = await get_html(url)
+        html = await get_html(url, cache=True, parser=_PARSER, until=until)
     except Exception:
         return ""
 
     return parse(html)
 
 
-def _dispatch_parser(parsed_url: SplitResult) -> _Parser | None:
+def _dispatch_parser(parsed_url: SplitResult) -> _Target | None:
     path = PurePath(parsed_url.path)
     category = (path.parts[1], path.parts[2])
 
     match category:
         case _ if category in _BOOK_CATEGORIES:
-            return _find_from_book
+            return _find_from_book, stop_at("table", id="work_maker")
         case _ if category in _DOUJIN_CATEGORIES:
-            return _find_from_doujin
+            return _find_from_doujin, stop_at("table", id="work_outline")
         case _:
             return None
 
@@ -5,6 +5,7 @@ from urllib.parse import SplitResult, parse_qs
 
 from bot.context import Context
 from bot.lib.fetch.aio import get_html, get_json
+from bot.lib.fetch.parser import fast_parser
 from bot.lib.keyboard import (
     make_av_keyboard,
     make_book_keyboard,
@@ -13,6 +14,12 @@ from bot.lib.keyboard import (
 from bot.types.answer import Answer
 
 
+HOSTS: set[str] = {
+    "www.dmm.co.jp",
+    "video.dmm.co.jp",
+    "tv.dmm.co.jp",
+    "book.dmm.co.jp",
+}
 _VIDEO_CATEGORIES: set[tuple[str, str]] = {
     ("digital", "videoa"),
     ("digital", "videoc"),
@@ -126,6 +133,8 @@ async def _find_doujin_author(*, url: str, parsed_url: SplitResult) -> tuple[str
             cookies={
                 "age_check_done": "1",
             },
+            cache=True,
+            parser=fast_parser(),
         )
     except Exception:
         return "", False
@@ -159,6 +168,8 @@ async def _find_book_author_from_www(*, url: str, parsed_url: SplitResult) -> st
             cookies={
                 "age_check_done": "1",
             },
+            cache=True,
+            parser=fast_parser("table"),
         )
     except Exception:
         return ""
@@ -189,6 +200,7 @@ async def _find_book_author_from_book(*, url: str, parsed_url: SplitResult) -> s
                 "shop_name": "adult",
                 "content_id": book_id,
             },
+            cache=True,
         )
     except Exception:
         return ""
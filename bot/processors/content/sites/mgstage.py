@@ -6,12 +6,14 @@ from bot.lib.keyboard import make_av_keyboard, make_link_preview
 from bot.types.answer import Answer
 
 
+HOSTS: set[str] = {
+    "www.mgstage.com",
+}
+
+
 async def solve(
     *, url: str, parsed_url: SplitResult, context: Context
 ) -> Answer | None:
-    if parsed_url.hostname != "www.mgstage.com":
-        return None
-
     path = PurePath(parsed_url.path)
     if path.parts[1] != "product":
         return None
@@ -7,6 +7,8 @@ from bs4 import BeautifulSoup
 
 from bot.context import Context
 from bot.lib.fetch.curl import get_html
+from bot.lib.fetch.parser import fast_parser
+from bot.lib.fetch.stream import stop_at
 from bot.lib.keyboard import make_book_keyboard, make_link_preview
 from bot.types.answer import Answer
 
@@ -15,6 +17,9 @@ type _Parser = Callable[[BeautifulSoup], str]
 
 
 _L = getLogger(__name__)
+HOSTS: set[str] = {
+    "nhentai.net",
+}
 
 
 async def solve(
@@ -32,14 +37,16 @@ async def solve(
 
 
 async def _find_author(*, url: str, parsed_url: SplitResult) -> str:
-    if parsed_url.hostname != "nhentai.net":
-        return ""
-
     if not parsed_url.path.startswith("/g/"):
         return ""
 
     try:
-        html = await get_html(url)
+        html = await get_html(
+            url,
+            cache=True,
+            parser=fast_parser("h2"),
+            until=stop_at("h2", class_="title"),
+        )
     except Exception:
         _L.exception("Failed to fetch HTML for URL: %s", url)
         return ""
@@ -9,7 +9,7 @@ from bot.types.answer import Answer
 
 
 _L = getLogger(__name__)
-_HOSTS: set[str] = {
+HOSTS: set[str] = {
     "nyaa.si",
     "sukebei.nyaa.si",
 }
@@ -18,9 +18,6 @@ _HOSTS: set[str] = {
 async def solve(
     *, url: str, parsed_url: SplitResult, context: Context
 ) -> Answer | None:
-    if parsed_url.hostname not in _HOSTS:
-        return None
-
     path = PurePath(parsed_url.path)
     if path.suffix != ".torrent":
         return None
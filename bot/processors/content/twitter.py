@@ -5,12 +5,17 @@ from urllib.parse import urlsplit, urlunsplit
 
 from bot.context import Context
 from bot.lib.keyboard import make_link_preview, make_save_keyboard
+from bot.processors.dispatch import DispatchTable, InputKind
 from bot.types.answer import Answer, Solver
 
 
 _L = getLogger(__name__)
 
 
+def register(table: DispatchTable, context: Context) -> None:
+    table.add("twitter", create_single_solver(context), InputKind.TWIMG_URL)
+
+
 def create_multiple_solver(context: Context) -> Solver:
     return _solve_multi_line
 
@@ -0,0 +1,70 @@
+import re
+from enum import StrEnum
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from bot.lib.host_index import HostIndex
+from bot.types.answer import Solver
+
+
+class InputKind(StrEnum):
+    # A URL on a host some site solver knows.
+    SITE_URL = "site_url"
+    # Any other URL.
+    URL = "url"
+    # A video.twimg.com URL.
+    TWIMG_URL = "twimg_url"
+    # A bare number.
+    NUMERIC_ID = "numeric_id"
+    # Free text, such as an AV code.
+    TEXT = "text"
+
+
+class NamedSolver(NamedTuple):
+    name: str
+    solve: Solver
+
+
+_NUMERIC_PATTERN = re.compile(r"^\d+$")
+_TWIMG_PATTERN = re.compile(r"^h?ttps://video\.twimg\.com/\S+$")
+
+
+class DispatchTable:
+    """
+    Which solvers can handle which kind of input.
+
+    Content modules register their solvers and hosts here; solvers for the
+    same kind keep their registration order as priority.
+    """
+
+    def __init__(self) -> None:
+        self._solvers: dict[InputKind, list[NamedSolver]] = {}
+        self._hosts = HostIndex[bool]()
+
+    def add(self, name: str, solver: Solver, /, *kinds: InputKind) -> None:
+        for kind in kinds:
+            self._solvers.setdefault(kind, []).append(NamedSolver(name, solver))
+
+    def add_hosts(self, hosts: set[str]) -> None:
+        for host in hosts:
+            self._hosts.add(host, True)
+
+    def classify(self, unknown_text: str) -> InputKind:
+        stripped = unknown_text.strip()
+        if _NUMERIC_PATTERN.match(stripped):
+            return InputKind.NUMERIC_ID
+        if _TWIMG_PATTERN.match(stripped):
+            return InputKind.TWIMG_URL
+
+        try:
+            parsed_url = urlsplit(stripped)
+        except ValueError:
+            return InputKind.TEXT
+        if parsed_url.scheme not in ("http", "https") or not parsed_url.hostname:
+            return InputKind.TEXT
+        if self._hosts.get(parsed_url.hostname):
+            return InputKind.SITE_URL
+        return InputKind.URL
+
+    def solvers_for(self, unknown_text: str) -> list[NamedSolver]:
+        return self._solvers.get(self.classify(unknown_text), [])
@@ -1,16 +1,48 @@
+import asyncio
+from asyncio import ensure_future, gather
+from collections import Counter
 from collections.abc import Awaitable, Callable, Iterator, Sequence
+from dataclasses import dataclass
 from functools import partial
 from logging import getLogger
 
 from bot.context import Context
+from bot.lib.answer_cache import get_answer_cache
+from bot.processors.dispatch import DispatchTable, NamedSolver
 from bot.types.answer import Answer, Solver
 
 
 _L = getLogger(__name__)
+# Key for timeouts of a whole solve stage in timeout_counter.
+_STAGE = "(stage)"
+
+# How often each solver, or a whole stage, ran out of time, by name.
+timeout_counter = Counter[str]()
 
 
 async def first_not_none[R](
     callbacks: Iterator[Callable[[], Awaitable[R | None]]],
+    *,
+    race: bool = False,
+    timeout: float | None = None,
+) -> R | None:
+    """
+    Return the first non-None result, in callback order.
+
+    With `race`, all callbacks start at once. A result is taken as soon as
+    every callback before it has finished with None, and the rest are
+    cancelled.
+    With `timeout`, everything still running is cancelled after that many
+    seconds and TimeoutError is raised.
+    """
+    async with asyncio.timeout(timeout):
+        if race:
+            return await _race(callbacks)
+        return await _sequence(callbacks)
+
+
+async def _sequence[R](
+    callbacks: Iterator[Callable[[], Awaitable[R | None]]],
 ) -> R | None:
     for cb in callbacks:
         try:
@@ -22,30 +54,179 @@ async def first_not_none[R](
     return None
 
 
+async def _race[R](
+    callbacks: Iterator[Callable[[], Awaitable[R | None]]],
+) -> R | None:
+    tasks = [ensure_future(cb()) for cb in callbacks]
+    try:
+        for task in tasks:
+            try:
+                rv = await task
+                if rv is not None:
+                    return rv
+            except Exception:
+                _L.exception("error in loop")
+        return None
+    finally:
+        pending = [task for task in tasks if not task.done()]
+        for task in pending:
+            task.cancel()
+        await gather(*pending, return_exceptions=True)
+
+
+@dataclass(frozen=True, kw_only=True)
+class _Timeouts:
+    # The whole solve stage of one input.
+    stage: float
+    # One solver, unless overridden by name.
+    solver: float
+    by_name: dict[str, float]
+
+    def for_solver(self, name: str) -> float:
+        return self.by_name.get(name, self.solver)
+
+
 def create_single_solver(context: Context) -> Solver:
-    from .content.jav import create_solver as jav
-    from .content.nh import create_solver as nh
-    from .content.sites import create_solver as sites
-    from .content.twitter import create_single_solver as twitter
+    from .content import jav, nh, sites, twitter
 
+    # Registration order is the priority within each kind of input.
     # NOTE jav should be the last.
-    type_list = [twitter, sites, jav, nh]
-    solver_list = [_(context) for _ in type_list]
+    table = DispatchTable()
+    for module in [twitter, sites, jav, nh]:
+        module.register(table, context)
 
-    return partial(_solve, solver_list=solver_list)
+    solve = partial(_dispatch, table=table, timeouts=_get_timeouts(context))
+    return partial(_solve_cached, kind="single", solve=solve)
 
 
 def create_multiple_solver(context: Context) -> Solver:
     from .content.twitter import create_multiple_solver as twitter
 
-    type_list = [twitter]
-    solver_list = [_(context) for _ in type_list]
+    solver_list = [NamedSolver("twitter", twitter(context))]
 
-    return partial(_solve, solver_list=solver_list)
+    # Not cached: the key would be the whole message, and the only solver
+    # here is a cheap pattern match.
+    return partial(_solve, solver_list=solver_list, timeouts=_get_timeouts(context))
+
+
+def _get_timeouts(context: Context) -> _Timeouts:
+    return _Timeouts(
+        stage=context.solve_timeout,
+        solver=context.solver_timeout,
+        by_name=context.solver_timeouts,
+    )
+
+
+async def _solve_cached(
+    unknown_text: str, /, *, kind: str, solve: Solver
+) -> Answer | None:
+    """
+    Go through the answer cache, if enabled.
+
+    The input is expected to be resolved by maybe_resolve_url already.
+    """
+    cache = get_answer_cache()
+    key = (kind, unknown_text.strip())
+    if cache:
+        if answer := cache.get(key):
+            return answer
+        if cache.has_no_answer(key):
+            return None
+
+    try:
+        answer = await solve(unknown_text)
+    except _Inconclusive:
+        # Worth trying again next time, so do not remember it.
+        return None
+
+    if cache:
+        cache.remember(key, answer)
+    return answer
+
+
+async def _dispatch(
+    unknown_text: str, /, *, table: DispatchTable, timeouts: _Timeouts
+) -> Answer | None:
+    solver_list = table.solvers_for(unknown_text)
+    if not solver_list:
+        return None
+    return await _try_solve(unknown_text, solver_list=solver_list, timeouts=timeouts)
+
+
+class _Inconclusive(Exception):
+    """No answer, but some solver timed out or failed before it could say."""
 
 
 async def _solve(
-    unknown_text: str, /, *, solver_list: Sequence[Solver]
+    unknown_text: str,
+    /,
+    *,
+    solver_list: Sequence[NamedSolver],
+    timeouts: _Timeouts,
+) -> Answer | None:
+    try:
+        return await _try_solve(
+            unknown_text, solver_list=solver_list, timeouts=timeouts
+        )
+    except _Inconclusive:
+        return None
+
+
+async def _try_solve(
+    unknown_text: str,
+    /,
+    *,
+    solver_list: Sequence[NamedSolver],
+    timeouts: _Timeouts,
+) -> Answer | None:
+    """Like _solve, but raise _Inconclusive instead of a doubtful None."""
+    # Names of solvers that did not finish properly.
+    failures: list[str] = []
+    callback_list = (
+        partial(
+            _solve_within,
+            _,
+            unknown_text,
+            timeout=timeouts.for_solver(_.name),
+            failures=failures,
+        )
+        for _ in solver_list
+    )
+    try:
+        answer = await first_not_none(callback_list, race=True, timeout=timeouts.stage)
+    except TimeoutError:
+        timeout_counter[_STAGE] += 1
+        _L.warning(
+            f"solving timed out after {timeouts.stage}s"
+            f" ({timeout_counter[_STAGE]} so far): {unknown_text}"
+        )
+        raise _Inconclusive() from None
+
+    if answer is None and failures:
+        raise _Inconclusive()
+    return answer
+
+
+async def _solve_within(
+    solver: NamedSolver,
+    unknown_text: str,
+    /,
+    *,
+    timeout: float,
+    failures: list[str],
 ) -> Answer | None:
-    callback_list = (partial(_, unknown_text) for _ in solver_list)
-    return await first_not_none(callback_list)
+    """Run one solver, giving up on it after `timeout` seconds."""
+    try:
+        async with asyncio.timeout(timeout):
+            return await solver.solve(unknown_text)
+    except TimeoutError:
+        failures.append(solver.name)
+        timeout_counter[solver.name] += 1
+        _L.warning(
+            f"{solver.name} timed out after {timeout}s"
+            f" ({timeout_counter[solver.name]} so far): {unknown_text}"
+        )
+        return None
+    except Exception:
+        failures.append(solver.name)
+        raise
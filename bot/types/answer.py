@@ -1,5 +1,6 @@
 from collections.abc import Awaitable, Callable
 from dataclasses import dataclass
+from typing import Any, Self
 
 from telegram import InlineKeyboardMarkup, LinkPreviewOptions
 
@@ -25,5 +26,15 @@ class Answer:
             "link_preview": self.link_preview.to_dict() if self.link_preview else None,
         }
 
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> Self:
+        """Rebuild an answer from the output of `to_dict`."""
+        return cls(
+            text=data["text"],
+            should_delete=data["should_delete"],
+            keyboard=InlineKeyboardMarkup.de_json(data["keyboard"]),
+            link_preview=LinkPreviewOptions.de_json(data["link_preview"]),
+        )
+
 
 type Solver = Callable[[str], Awaitable[Answer | None]]